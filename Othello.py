@@ -6,49 +6,73 @@ Peter Elmers
 """
 
 import OthelloAI as ai
-import sys, time
+import OthelloPosition
+import OthelloRecord
+import OthelloStats
+import OthelloTT as tt
+import argparse, multiprocessing, random, sys, time
 
 # screen width for progress bar, assumed 80
 WID = 80
+WHITE = 1
+BLACK = -1
 HUMAN = 0
 RANDOM = 1
 SHALLOW = 2
 MINIMAX = 3
 ALPHABETA = 4
+PVS = 5
+MCTS = 6
 
 class GameBoard(object):
     """
     GameBoard implements the board itself and methods associated with it
     Handles tasks such as output, move playing, game over conditions,
     listing available moves, scores
+    The position itself is an OthelloPosition held in self.position, replaced
+    by a new one on every move; board, side, unplayed, hash and the counts read it
+    The engine option picks the board storage: "list" or "bitboard"
+    ai_options are passed on as keyword arguments to each OthelloAI
     """
-    def __init__(self,white_char='O',black_char='X',white_source="human", black_source="human",starting_board="default"):
-        self.BORDER=2
-        self.EMPTY=0
+    def __init__(self,white_char='O',black_char='X',white_source="human", black_source="human",starting_board="default",engine="list",ai_options=None):
+        self.BORDER=OthelloPosition.BORDER
+        self.EMPTY=OthelloPosition.EMPTY
         # WHITE and BLACK must be opposite integers
-        self.WHITE=1
-        self.BLACK=-1
-        # generate board as list of 100 integers, 8x8 enclosed in 10x10 with borders
-        self.board=[self.EMPTY for i in range(100)]
-        for i in range(100):
-                if (i % 10 == 0 or i % 10 == 9 or i<10 or i>89):
-                    self.board[i] = self.BORDER
-        self.board[44] = self.board[55] = self.WHITE
-        self.board[45] = self.board[54] = self.BLACK
-        self.board_range = [i for i in range(11,89) if self.board[i] != self.BORDER]
+        self.WHITE=WHITE
+        self.BLACK=BLACK
+        self.engine = engine
+        self.position = OthelloPosition.from_board(OthelloPosition.start_board(), self.BLACK, engine)
+        self.board_range = OthelloPosition.BOARD_RANGE
         self.white_char = white_char
         self.black_char = black_char
         self.white_source = white_source
         self.black_source = black_source
+        self.last_move = "[no move played yet]"
+        # moves played by play_turn, None for a pass
+        self.history = []
         # start AI if it is playing
+        ai_options = ai_options or {}
         if self.white_source != "human":
-            self.ai_white = ai.OthelloAI(self,self.WHITE,self.white_source,starting_board)
+            self.ai_white = ai.OthelloAI(self,self.WHITE,self.white_source,starting_board,**ai_options)
         if self.black_source != "human":
-            self.ai_black = ai.OthelloAI(self,self.BLACK,self.black_source,starting_board)
-        self.directions = [1,-1,10,-10,9,-9,11,-11]
-        self.side= self.BLACK 
-        self.unplayed = 0
-        self.last_move = "[no move played yet]"
+            self.ai_black = ai.OthelloAI(self,self.BLACK,self.black_source,starting_board,**ai_options)
+
+    def _set_side(self, side):
+        self.position = self.position.with_turn(side, self.position.passes)
+
+    def _set_unplayed(self, unplayed):
+        self.position = self.position.with_turn(self.position.side, unplayed)
+
+    # the position's state, side and unplayed (passes in a row) can be set for a new position
+    board = property(lambda self: self.position.board)
+    side = property(lambda self: self.position.side, _set_side)
+    unplayed = property(lambda self: self.position.passes, _set_unplayed)
+    hash = property(lambda self: self.position.hash)
+    white_count = property(lambda self: self.position.white_count)
+    black_count = property(lambda self: self.position.black_count)
+    empty_count = property(lambda self: self.position.empty_count)
+    weight_score = property(lambda self: self.position.weight_score)
+    pattern_indices = property(lambda self: self.position.pattern_indices)
 
     def repr_board(self):
         """
@@ -72,102 +96,201 @@ class GameBoard(object):
         scores = self.find_victor()
         output += "\nCurrent score:\nBlack: %s\nWhite: %s" % (scores[2], scores[1])
         return output+'\nLast move was: %s' % (self.last_move)
-    
+
+    def compute_hash(self):
+        """
+        Return the Zobrist hash of the discs on the board, computed from scratch.
+        Positions keep their hash up to date after this.
+        """
+        return OthelloPosition.board_hash(self.board)
+
+    def compute_counts(self):
+        """
+        Return the white, black and empty square counts and the weight score
+        (sum of ai.WEIGHTS of white discs minus black discs), computed from scratch.
+        Positions keep the counts up to date after this.
+        """
+        return OthelloPosition.board_counts(self.board)
+
+    def position_key(self, side):
+        """
+        Return the hash of the current position with side to move.
+        """
+        if side == self.BLACK:
+            return self.position.hash ^ tt.BLACK_TO_MOVE
+        return self.position.hash
+
+    def enable_patterns(self):
+        """
+        Start keeping pattern_indices up to date, for OthelloPattern evaluation.
+        """
+        self.position = self.position.with_patterns()
+
+    def mobility(self, side):
+        """
+        Return the number of legal moves of side.
+        """
+        return self.position.mobility(side)
+
+    def bits(self, side):
+        """
+        Return the bitboards of side and its opponent.
+        """
+        return self.position.bits(side)
+
     def flipped_squares(self, move_pos, side):
         """
         Return a list of positions that would be flipped by a tile played at move_pos.
         """
-        to_flip = []
-        for direction in self.directions:
-            next_pos = move_pos + direction
-            if self.board[next_pos] == -side:
-                flip_this_dir = [next_pos]
-                while True:
-                    next_pos += direction
-                    if (self.board[next_pos] == self.EMPTY) or (self.board[next_pos] == self.BORDER):
-                        break
-                    if self.board[next_pos] == -side:
-                        flip_this_dir.append(next_pos)
-                        continue
-                    elif self.board[next_pos] == side:
-                        to_flip += flip_this_dir
-                        break
-        return to_flip
+        return self.position.flipped_squares(move_pos, side)
 
     def legal_move(self, move_pos, side):
         """
         Return False if move is not legal.
         Return list of tiles to flip if legal.
         """
-        if self.board[move_pos] != self.EMPTY:
-            return False
-        else:
-            flipped = self.flipped_squares(move_pos, side)
-            if len(flipped) == 0:
-                return False
-            else:
-                 return flipped
-    
-    def make_move(self, move_pos, side):
+        return self.position.legal_move(move_pos, side)
+
+    def legal_moves(self, side):
         """
-        Try to make a move on the current board.
+        Return a list of (move, flips) for every legal move of side, in board_range order.
+        flips can be passed back to make_move to skip recomputing them.
+        """
+        return self.position.legal_moves(side)
+
+    def make_move(self, move_pos, side, to_flip=None):
+        """
+        Try to play move_pos as side's turn: afterwards the opponent is to move.
         Return False if move is illegal.
-        If move is legal, return True and make the move.
+        If move is legal, make the move and return an undo record for unmake_move.
+        to_flip is the flips legal_moves gave for this move, if known.
         """
-        to_flip = self.legal_move(move_pos, side)
-        if to_flip == False:
+        position = self.position
+        if position.side != side:
+            position = position.with_turn(side, position.passes)
+        after = position.play(move_pos, to_flip)
+        if after is None:
             return False
-        for pos in to_flip:
-            self.board[pos] = side
-        self.board[move_pos] = side
-        return True
+        # the undo record is the position before, which never changes
+        undo = self.position
+        self.position = after
+        return undo
+
+    def unmake_move(self, undo):
+        """
+        Take back a move using the undo record returned by make_move.
+        Moves must be taken back in the reverse order they were made.
+        """
+        self.position = undo
+
+    def pass_turn(self):
+        """
+        Pass the turn of the side to move.
+        """
+        self.position = self.position.pass_turn()
+
+    def snapshot(self):
+        """
+        Return the position state that restore can go back to.
+        """
+        return self.position
+
+    def restore(self, state):
+        """
+        Go back to a position state returned by snapshot.
+        """
+        self.position = state
+
+    def load_position(self, text, side):
+        """
+        Set up the position given as 64 characters, row by row from square 11:
+        white_char for white, black_char for black, '-' or '.' for empty.
+        Whitespace is ignored. side is the side to move.
+        """
+        cells = ''.join(text.split())
+        if len(cells) != 64:
+            raise ValueError("a position needs 64 squares, got %i" % len(cells))
+        values = {self.white_char: self.WHITE, self.black_char: self.BLACK, '-': self.EMPTY, '.': self.EMPTY}
+        board = [self.BORDER for i in range(100)]
+        for pos, cell in zip(self.board_range, cells):
+            if cell not in values:
+                raise ValueError("unknown square %r in position" % cell)
+            board[pos] = values[cell]
+        self.position = OthelloPosition.from_board(board, side, self.engine,
+                                                   patterns=self.pattern_indices is not None)
+        self.last_move = "[no move played yet]"
+        self.history = []
+
+    def position_string(self):
+        """
+        Return the position as the 64 characters load_position reads.
+        """
+        chars = {self.WHITE: self.white_char, self.BLACK: self.black_char, self.EMPTY: '-'}
+        board = self.board
+        return ''.join(chars[board[pos]] for pos in self.board_range)
 
-    def get_move(self, side, source=HUMAN):
+    def clone(self):
+        """
+        Return a board of the same engine in the same position, without AI players.
+        """
+        game = GameBoard(white_char=self.white_char, black_char=self.black_char, engine=self.engine)
+        game.restore(self.snapshot())
+        game.last_move = self.last_move
+        return game
+
+    def get_move(self, side, source=HUMAN, moves=None):
         """
         Return a move by querying the appropriate source.
+        moves is the result of legal_moves(side), if already known.
+        An AI opponent with the ponder option searches while a human thinks.
         """
         if source == HUMAN:
-            while True:
-                possible_moves = []
-                for pos in self.board_range:
-                    if self.legal_move(pos, side):
-                        possible_moves.append(str(pos))
-                print "Possible moves: %s" % (' '.join(possible_moves))
-                try:
-                    move = int(raw_input("Enter your move (sum of row and column): "))
-                    if str(move) not in possible_moves:
-                        print "Invalid move, please try again."
-                        continue
-                except ValueError:
-                    print "Invalid move, please try again."
-                    continue
-                break
+            if moves is None:
+                moves = self.legal_moves(side)
+            opponent = getattr(self, 'ai_black' if side == self.WHITE else 'ai_white', None)
+            if opponent is not None:
+                opponent.start_pondering()
+            try:
+                move = self.get_human_move(moves)
+            finally:
+                if opponent is not None:
+                    opponent.stop_pondering()
         else:
             if side == self.WHITE:
                 move = self.ai_white.find_move()
             if side == self.BLACK:
                 move = self.ai_black.find_move()
         return move
+
+    def get_human_move(self, moves):
+        """
+        Return a move typed in by the player, one of moves (from legal_moves).
+        """
+        possible_moves = [str(pos) for pos, flipped in moves]
+        while True:
+            print "Possible moves: %s" % (' '.join(possible_moves))
+            try:
+                move = int(raw_input("Enter your move (sum of row and column): "))
+                if str(move) not in possible_moves:
+                    print "Invalid move, please try again."
+                    continue
+            except ValueError:
+                print "Invalid move, please try again."
+                continue
+            return move
     
     def test_possible_moves(self, side):
         """
         Return True if the side has any possible moves.
         If no moves are possible, return False.
         """
-        for pos in self.board_range:
-            if self.legal_move(pos, side):
-                return True
-        return False
+        return self.position.has_moves(side)
 
     def test_end(self):
         """
         Return True if game has ended, else False.
         """
-        if self.unplayed == 2:
-            return True
-        if sum([1 for i in self.board_range if self.board[i] == self.EMPTY]) == 0:
-            return True
-        return False
+        return self.position.is_over()
         
     
     def play_turn(self,show=True):
@@ -179,20 +302,18 @@ class GameBoard(object):
             print self
         if self.test_end() == True:
             return False
-        if self.test_possible_moves(self.side) == False:
-            self.unplayed += 1
-            self.side = -self.side
+        moves = self.legal_moves(self.side)
+        if not moves:
+            self.pass_turn()
+            self.history.append(None)
             return True
         if self.side == self.WHITE:
-            move = self.get_move(self.side, self.white_source)
-            self.last_move = move
-            self.make_move(move,self.side)
+            move = self.get_move(self.side, self.white_source, moves)
         elif self.side == self.BLACK:
-            move = self.get_move(self.side, self.black_source)
-            self.last_move = move
-            self.make_move(move,self.side)
-        self.side = -self.side
-        self.unplayed = 0
+            move = self.get_move(self.side, self.black_source, moves)
+        self.last_move = move
+        self.history.append(move)
+        self.make_move(move,self.side,dict(moves)[move])
         return True
 
     
@@ -201,8 +322,8 @@ class GameBoard(object):
         Find the winner and scores of each player of the game.
         Assume that the game is finished.
         """
-        white_count = sum([1 for i in self.board_range if (self.board[i]==self.WHITE)])
-        black_count = sum([1 for i in self.board_range if (self.board[i]==self.BLACK)])
+        white_count = self.white_count
+        black_count = self.black_count
         if white_count > black_count:
             return self.WHITE, white_count, black_count
         elif black_count > white_count:
@@ -236,8 +357,109 @@ def menu(choices_list,message):
     return choice
 
 
+def play_game(white_source, black_source, starting_board="default", engine="list", seed=None, ai_options=None):
+    """
+    Play one game between two AI sources without printing anything.
+    Seed the random module first if seed is given.
+    Return the victor and the white and black scores, like find_victor.
+    """
+    return _run_game(white_source, black_source, starting_board, engine, seed, ai_options).find_victor()
+
+def _run_game(white_source, black_source, starting_board, engine, seed, ai_options):
+    if seed is not None:
+        random.seed(seed)
+    game = GameBoard(white_source=white_source, black_source=black_source,
+                     starting_board=starting_board, engine=engine, ai_options=ai_options)
+    Playing = True
+    while Playing:
+        Playing = game.play_turn(show=False)
+    return game
+
+def _play_simulated_game(args):
+    # module level so that multiprocessing can pickle it
+    game = _run_game(*args)
+    summary = None
+    if game.ai_white.stats is not None:
+        summary = OthelloStats.summarize(game.ai_white.stats.records + game.ai_black.stats.records)
+    return game.find_victor() + (summary, args[4], game.history)
+
+def simulate(white_source, black_source, sim_number, starting_board="default", engine="list",
+             workers=1, seed=0, ai_options=None, progress=True, record=None):
+    """
+    Play sim_number games and return a dictionary of the results:
+    games, black_wins, white_wins, draws, black_discs, white_discs and seconds.
+    With ai_options {'stats': True} it also has search, the OthelloStats
+    summary of every move of every game.
+    record is the path of an OthelloRecord file every game is appended to;
+    ValueError is raised before any game if their seeds do not fit in it.
+    Game i is played with random seed seed+i, so the results are the same
+    for any number of workers. workers > 1 plays the games in a process pool.
+    """
+    if record is not None:
+        OthelloRecord.check_seeds(seed, sim_number)
+    tasks = [(white_source, black_source, starting_board, engine, seed+sim, ai_options)
+             for sim in range(sim_number)]
+    stats = {'games': sim_number, 'black_wins': 0, 'white_wins': 0, 'draws': 0,
+             'black_discs': 0, 'white_discs': 0}
+    pool = None
+    writer = None
+    if record is not None:
+        writer = OthelloRecord.RecordWriter(record)
+    Start = time.time()
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        # games finish in any order, chunks keep the workers busy with little overhead
+        results = pool.imap_unordered(_play_simulated_game, tasks, max(1, sim_number // (workers*16)))
+    else:
+        results = (_play_simulated_game(task) for task in tasks)
+    percent = None
+    try:
+        for done, (victor, whites, blacks, summary, game_seed, history) in enumerate(results):
+            if writer is not None:
+                writer.write(white_source, black_source, game_seed, whites, blacks, history)
+            if summary is not None:
+                if 'search' in stats:
+                    OthelloStats.merge(stats['search'], summary)
+                else:
+                    stats['search'] = summary
+            if victor == WHITE:
+                stats['white_wins'] += 1
+            elif victor == BLACK:
+                stats['black_wins'] += 1
+            else:
+                stats['draws'] += 1
+            stats['white_discs'] += whites
+            stats['black_discs'] += blacks
+            new_percent = round(float(done+1)/float(sim_number),2)*100
+            if progress and new_percent != percent:
+                sys.stdout.write(progress_bar(WID, new_percent))
+                sys.stdout.flush()
+                percent = new_percent
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if writer is not None:
+            writer.close()
+    stats['seconds'] = time.time() - Start
+    return stats
+
+def print_simulation(stats):
+    """
+    Print the win percentages and timing of a simulate() result.
+    """
+    sim_number = stats['games']
+    print "Black %s\nWhite %s\nDraw %s" % (str(round(float(stats['black_wins'])/float(sim_number),3)*100)+r'%',
+        str(round(float(stats['white_wins'])/float(sim_number),3)*100)+r'%', str(round(float(stats['draws'])/float(sim_number),3)*100)+r'%')
+    print "Average score: black %.2f, white %.2f" % (float(stats['black_discs'])/sim_number,
+        float(stats['white_discs'])/sim_number)
+    print "Simulation lasted %.3f seconds, %.3f seconds per game." % (stats['seconds'], stats['seconds']/sim_number)
+    if 'search' in stats:
+        OthelloStats.print_summary(stats['search'])
+
 def main():
-    sources = ['Human','Random','Shallow searcher (1-ply)','Brute Minimax (3-ply)','Alphabeta pruning (3-ply)']
+    sources = ['Human','Random','Shallow searcher (1-ply)','Brute Minimax (3-ply)','Alphabeta pruning (3-ply)',
+               'Principal variation search (3-ply)','Monte Carlo tree search (1000 playouts)']
     black_source = menu(sources,"Source for black player: ")
     white_source = menu(sources,"Source for white player: ")
     sim_number = 0
@@ -249,10 +471,20 @@ def main():
                 randomize = "random"
             else:
                 randomize = "default"
+            workers = raw_input("How many worker processes? [1] ")
+            workers = int(workers) if workers else 1
             output = '\n'
+    engine = "list"
+    if raw_input("Do you want to use the bitboard engine? [Y/n] ") in ['y','Y','yes','Yes']:
+        engine = "bitboard"
     if sim_number == 0:
         # non-simulation portion of main()
-        game = GameBoard(white_source=white_source, black_source=black_source)    
+        ai_options = {}
+        if HUMAN in (white_source, black_source) and (white_source, black_source) != (HUMAN, HUMAN):
+            if raw_input("Should the AI think during your turns? [Y/n] ") in ['y','Y','yes','Yes']:
+                ai_options['ponder'] = True
+        game = GameBoard(white_source=white_source, black_source=black_source, engine=engine,
+                         ai_options=ai_options)
         Playing = True
         while Playing:
             Playing = game.play_turn()
@@ -265,38 +497,80 @@ def main():
             print "The game is tied with a score of %s to %s" % (whites, blacks)
     else:
         # simulation processing and output
-        percent = None
-        black_wins = 0
-        white_wins = 0
-        draws = 0
-        Start = time.clock()
-        # ready, set, go!
-        for sim in range(sim_number):
-            new_percent = round(float(sim)/float(sim_number),2)*100
-            if new_percent != percent or percent is None:
-               sys.stdout.write(progress_bar(WID, new_percent)) 
-               sys.stdout.flush()
-               percent = new_percent
-            game = GameBoard(white_source=white_source, black_source=black_source,starting_board=randomize)
-            Playing = True
-            while Playing:
-                Playing = game.play_turn(show=False)
-            victor, whites, blacks = game.find_victor()
-            if victor == game.WHITE:
-                #output += "White wins %s to %s \n" % (whites, blacks)
-                white_wins += 1
-            elif victor == game.BLACK:
-                #output += "Black wins %s to %s \n" % (blacks, whites)
-                black_wins += 1
-            else:
-                #output += "Game tied %s to %s \n" % (whites, blacks)
-                draws += 1
-        End = time.clock()
+        stats = simulate(white_source, black_source, sim_number, starting_board=randomize,
+                         engine=engine, workers=workers)
         print output
-        print "Black %s\nWhite %s\nDraw %s" % (str(round(float(black_wins)/float(sim_number),3)*100)+r'%',
-            str(round(float(white_wins)/float(sim_number),3)*100)+r'%', str(round(float(draws)/float(sim_number),3)*100)+r'%')
-        print "Simulation lasted %.3f seconds, %.3f seconds per game." % ((End-Start),(End-Start)/sim_number)
+        print_simulation(stats)
+
+def cli(argv):
+    """
+    Simulate games from command line arguments instead of the menus.
+    Strategies are given by number: 1 random, 2 shallow, 3 minimax, 4 alphabeta, 5 PVS, 6 MCTS.
+    """
+    parser = argparse.ArgumentParser(description="Simulate Othello games between AI players.")
+    parser.add_argument("--black", type=int, required=True, help="strategy of the black player")
+    parser.add_argument("--white", type=int, required=True, help="strategy of the white player")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--workers", type=int,
+                        help="worker processes (default: one per CPU, one with --search-workers)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--random-start", action="store_true", help="play the first moves randomly")
+    parser.add_argument("--engine", choices=["list", "bitboard"], default="list")
+    parser.add_argument("--batch", action="store_true",
+                        help="play random and shallow games in lockstep with NumPy")
+    parser.add_argument("--book", help="opening book file for the AI players")
+    parser.add_argument("--stats", action="store_true", help="report statistics of the AI searches")
+    parser.add_argument("--evaluation", choices=["weights", "pattern"], default="weights",
+                        help="how the AI players score positions")
+    parser.add_argument("--patterns", help="pattern table file for --evaluation pattern")
+    parser.add_argument("--record", help="file to append the moves of every game to")
+    parser.add_argument("--playouts", type=int, help="playouts per MCTS move")
+    parser.add_argument("--playout", choices=["random", "weighted"], default="random",
+                        help="how MCTS playouts pick their moves")
+    parser.add_argument("--search-workers", type=int, default=1,
+                        help="processes for each alphabeta search (only with --workers 1)")
+    args = parser.parse_args(argv)
+    if args.workers is None:
+        args.workers = 1 if args.search_workers > 1 else multiprocessing.cpu_count()
+    if args.workers > 1 and args.search_workers > 1:
+        parser.error("--search-workers only works with --workers 1")
+    starting_board = "random" if args.random_start else "default"
+    ai_options = {}
+    if args.book:
+        ai_options['book'] = args.book
+    if args.stats:
+        ai_options['stats'] = True
+    if args.search_workers > 1:
+        ai_options['workers'] = args.search_workers
+    if args.evaluation != "weights":
+        ai_options['evaluation'] = args.evaluation
+    if args.patterns:
+        ai_options['pattern_file'] = args.patterns
+    if args.playouts:
+        ai_options['playouts'] = args.playouts
+    if args.playout != "random":
+        ai_options['playout'] = args.playout
+    if args.batch and args.record:
+        parser.error("--record does not work with --batch")
+    if args.record:
+        try:
+            OthelloRecord.check_seeds(args.seed, args.games)
+        except ValueError as error:
+            parser.error(str(error))
+    if args.batch:
+        import OthelloBatch
+        stats = OthelloBatch.simulate(args.white, args.black, args.games,
+                                      starting_board=starting_board, seed=args.seed)
+    else:
+        stats = simulate(args.white, args.black, args.games, starting_board=starting_board,
+                         engine=args.engine, workers=args.workers, seed=args.seed,
+                         ai_options=ai_options, record=args.record)
+    print
+    print_simulation(stats)
 
 
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 1:
+        cli(sys.argv[1:])
+    else:
+        main()
@@ -5,7 +5,15 @@ AI component of Othello board game
 Peter Elmers
 """
 
-import random, sys
+import OthelloBitboard as bb
+import OthelloBook
+import OthelloEndgame
+import OthelloMCTS
+import OthelloParallel
+import OthelloPattern
+import OthelloStats
+import OthelloTT as tt
+import random, sys, threading, time
 
 # possible sources
 HUMAN = 0
@@ -13,6 +21,48 @@ RANDOM = 1
 SHALLOW = 2
 MINIMAX = 3
 ALPHABETA = 4
+PVS = 5
+MCTS = 6
+
+# some positions are better, some worse
+WEIGHTS = [
+    0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+    0,120,-20, 20,  5,  5, 20,-20,120,  0,
+    0,-20,-40, -5, -5, -5, -5,-40,-20,  0,
+    0, 20, -5,  3,  3,  3,  3, -5, 20,  0,
+    0,  5, -5,  3,  3,  3,  3, -5,  5,  0,
+    0,  5, -5,  3,  3,  3,  3, -5,  5,  0,
+    0, 20, -5,  3,  3,  3,  3, -5, 20,  0,
+    0,-20,-40, -5, -5, -5, -5,-40,-20,  0,
+    0,120,-20, 20,  5,  5, 20,-20,120,  0,
+    0,  0,  0,  0,  0,  0,  0,  0,  0,  0]
+
+# principal variation search score of a won game, above any evaluation
+WIN = 10**9
+# killer moves kept for each remaining depth
+KILLERS = 2
+# playouts of a Monte Carlo tree search move without a time budget
+MCTS_PLAYOUTS = 1000
+# empty squares from which minimax, alphabeta and PVS players solve the game exactly
+ENDGAME_EMPTIES = 12
+# share of a time budget (and seconds at least) kept back for noticing the
+# deadline, unwinding the search and returning the move
+TIME_MARGIN = 0.1
+MIN_TIME_MARGIN = 0.001
+# searches look at the clock when the node count has none of these bits set
+CLOCK_MASK = 7
+
+def budget_deadline(start, time_budget):
+    """
+    Return the time a search given time_budget seconds at start has to stop by.
+    """
+    return start + time_budget - max(time_budget * TIME_MARGIN, MIN_TIME_MARGIN)
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search once the deadline for the current move has passed.
+    """
+    pass
 
 class OthelloAI(object):
     """
@@ -21,25 +71,78 @@ class OthelloAI(object):
     Shallow is essentially a 1-ply search: it picks the move that appears to be the best
     Minimax searches all nodes of a game tree to given depth to find a move
     Alphabeta uses minimax with cutoffs to simplify the game tree
+    PVS finds the same move as alphabeta with a negamax principal variation
+    search, ordering moves by hash move, killer moves, history and WEIGHTS
+    MCTS grows a Monte Carlo search tree, kept from move to move, for playouts
+    playouts (MCTS_PLAYOUTS by default) or the time budget; playout is "random"
+    or "weighted" (by WEIGHTS) for how the playouts pick moves
+    tt_size caps the number of entries in the alphabeta transposition table,
+    which is kept for the whole game
+    time_budget (seconds) makes minimax, alphabeta and PVS deepen while the next
+    search is expected to fit in it; searches stop TIME_MARGIN short of it
+    book is the path of an opening book file consulted before searching
+    With endgame_empties or fewer empty squares minimax, alphabeta and PVS solve
+    the game exactly instead
+    stats=True keeps an OthelloStats record of every move in self.stats.records
+    workers > 1 searches the alphabeta root moves in that many processes
+    ponder=True lets minimax, alphabeta and PVS search the replies to a human's
+    possible moves while the human thinks, see start_pondering
+    evaluation is "weights" (the WEIGHTS table) or "pattern" (OthelloPattern
+    tables, read from pattern_file if given, and mobility)
     """
-    def __init__(self, gameObject, side, strat=RANDOM,start="default"):
+    def __init__(self, gameObject, side, strat=RANDOM,start="default",tt_size=tt.DEFAULT_SIZE,time_budget=None,book=None,
+                 endgame_empties=ENDGAME_EMPTIES,stats=False,workers=1,ponder=False,evaluation="weights",
+                 pattern_file=None,playouts=None,playout="random"):
         self.game = gameObject
         self.side = side
         self.strat = strat
         self.board_start = start
         self.move_count = 0
-        # some positions are better, some worse
-        self.weights = [
-        0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
-        0,120,-20, 20,  5,  5, 20,-20,120,  0,
-        0,-20,-40, -5, -5, -5, -5,-40,-20,  0,
-        0, 20, -5,  3,  3,  3,  3, -5, 20,  0,
-        0,  5, -5,  3,  3,  3,  3, -5,  5,  0,
-        0,  5, -5,  3,  3,  3,  3, -5,  5,  0,
-        0, 20, -5,  3,  3,  3,  3, -5, 20,  0,
-        0,-20,-40, -5, -5, -5, -5,-40,-20,  0,
-        0,120,-20, 20,  5,  5, 20,-20,120,  0,
-        0,  0,  0,  0,  0,  0,  0,  0,  0,  0]
+        self.tt = tt.TranspositionTable(tt_size)
+        self.time_budget = time_budget
+        # searches raise SearchTimeout once time.time() passes the deadline
+        self.deadline = None
+        self.nodes = 0
+        self.book = None
+        if book is not None:
+            self.book = OthelloBook.open_book(book)
+        self.endgame_empties = endgame_empties
+        self.workers = workers
+        self.ponder = ponder
+        # position_key -> (source, depth, move) found while pondering
+        self.ponder_cache = {}
+        self.ponder_thread = None
+        self.ponder_stop = None
+        # a threading.Event that stops the search once set, checked with the deadline
+        self.stop = None
+        self.solver = OthelloEndgame.EndgameSolver()
+        # None unless stats are wanted, searches only check for that
+        self.stats = None
+        if stats:
+            self.stats = OthelloStats.SearchStats()
+        # how the last move was found and how deep, set by choose_move
+        self.last_source = None
+        self.last_depth = None
+        # positions keep the sum of WEIGHTS up to date, evaluate_state relies on it
+        self.weights = WEIGHTS
+        if evaluation not in ("weights", "pattern"):
+            raise ValueError("unknown evaluation %r" % evaluation)
+        self.evaluation = evaluation
+        self.pattern_file = pattern_file
+        self.evaluator = None
+        if evaluation == "pattern":
+            self.evaluator = OthelloPattern.PatternEvaluator(pattern_file)
+            self.game.enable_patterns()
+        # principal variation search move ordering: killer moves by remaining depth,
+        # and the history score of each square, raised by every cutoff it makes
+        self.killers = []
+        self.history = [0] * 100
+        if playout not in ("random", "weighted"):
+            raise ValueError("unknown playout %r" % playout)
+        self.playouts = playouts
+        self.mcts = OthelloMCTS.MonteCarloSearch(WEIGHTS if playout == "weighted" else None)
+        # playouts of the last move, set by mcts_search
+        self.last_playouts = None
 
         # is lookup in dicts faster than list?
         # self.weights = dict((k,v) for k,v in enumerate(self.weights))
@@ -60,178 +163,704 @@ class OthelloAI(object):
         # for pos in self.game.board_range:
         #    if self.game.legal_move(pos, self.side):
         #        possible_moves.append(pos)
-        return random.choice([p for p in self.game.board_range if self.game.legal_move(p,self.side)])
+        return random.choice(self.game.legal_moves(self.side))[0]
 
-    def evaluate_state(self,side):
+    def evaluate_state(self,position,side):
         """
         Return a score that evaluates the state of the board.
         Uses side to determine which side's point of view to take.
         """
-        score = 0
-        if self.game.test_end():
-            if self.game.find_victor()[0] == side:
+        if position.is_over():
+            victor = position.victor()[0]
+            if victor == side:
                 return float("inf") # positive infinity because win
-            elif self.game.find_victor()[0] == -side:
+            elif victor == -side:
                 return float("-inf")  # negative infinity because loss
-        for pos in self.game.board_range:
-            if self.game.board[pos] == side:
-                score += self.weights[pos]
-            elif self.game.board[pos] == -side:
-                score -= self.weights[pos]
-        return score
+        if self.evaluator is not None:
+            return side * self.evaluator.score(position)
+        # weight_score is the white discs' weights minus the black discs'
+        return side * position.weight_score
+
+    def search_position(self,position=None):
+        """
+        Return position (the game's position if None) as the BitboardPosition
+        the searches run on, whatever the game's engine: a ListPosition copies
+        its board on every move.
+        """
+        if position is None:
+            position = self.game.position
+        return position.as_bitboard()
 
     def shallow_search(self):
         """
         Return a move that results in the best outcome immediately following it.
         """
-        original_board = self.game.board[:] #backup original
         max_score = float("-inf")
+        position = self.search_position()
         # initialize dictionary of score for each position
         scores = dict((pos,None) for pos in self.game.board_range)
-        for pos in self.game.board_range:
-           if self.game.make_move(pos,self.side)==False:
-               continue # illegal move
-           else:
-               score = self.evaluate_state(self.side)
-               scores[pos]=score
-               self.game.board = original_board[:] # reset board
+        for pos, flips in position.legal_moves(self.side):
+            self.nodes += 1
+            if self.stats is not None:
+                self.stats.leaves += 1
+            scores[pos] = self.evaluate_state(position.play(pos,flips),self.side)
         for pos, score in scores.iteritems():
             if score != None and score >= max_score:
                 move = pos
                 max_score = score
         return move
 
-    def maximize(self,ply,side):
+    def maximize(self,position,ply):
         """
-        Return the maximum score possible from the current position.
-        Use for playing side's move.
+        Return the maximum score possible from position.
+        Use for playing side's move, the side to move in position.
         """
-        if ply == 0 or self.game.test_end():
-            return self.evaluate_state(side) 
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & CLOCK_MASK:
+            self.check_time()
+        if ply == 0 or position.is_over():
+            if self.stats is not None:
+                self.stats.leaves += 1
+            return self.evaluate_state(position,position.side)
+        moves = position.moves()
+        if not moves:
+            # a pass takes no ply, the game is over once both sides pass
+            return self.minimize(position.pass_turn(),ply)
         score = float("-inf")
-        current_board = self.game.board[:]
-        for pos in self.game.board_range:
-            if self.game.make_move(pos,side) == False:
-                continue
-            self.game.side = side
-            score = max(score,self.minimize(ply-1,-side))
-            # reset board for next iteration
-            self.game.board = current_board[:]
+        for pos, flips in moves:
+            score = max(score,self.minimize(position.play(pos,flips),ply-1))
         return score
 
-    def minimize(self,ply,side):
+    def minimize(self,position,ply):
         """
-        Return the lowest score possible from this position.
-        Use for opponent's move.
+        Return the lowest score possible from position.
+        Use for opponent's move, the side to move in position.
         """
-        if ply == 0 or self.game.test_end():
-            return self.evaluate_state(side)
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & CLOCK_MASK:
+            self.check_time()
+        if ply == 0 or position.is_over():
+            if self.stats is not None:
+                self.stats.leaves += 1
+            # score from the point of view of the maximizing side
+            return self.evaluate_state(position,-position.side)
+        moves = position.moves()
+        if not moves:
+            return self.maximize(position.pass_turn(),ply)
         score = float("inf")
-        current_board = self.game.board[:]
-        for pos in self.game.board_range:
-            if self.game.make_move(pos,side) == False: 
-                continue
-            self.game.side = side
-            score = min(score,self.maximize(ply-1,-side))
-            self.game.board = current_board[:] # resetting board
+        for pos, flips in moves:
+            score = min(score,self.maximize(position.play(pos,flips),ply-1))
         return score
 
-    def minimax_search(self,maxply):
+    def minimax_search(self,maxply,position=None):
         """
-        Return a move by using a minimax search to maxply levels deep.
+        Return a move by using a minimax search to maxply levels deep,
+        from position or the game's position.
         """
-        current_board = self.game.board[:]
-        best_score = None
-        for pos in self.game.board_range:
-            if self.game.make_move(pos,self.game.side) == False:
-                continue
-            result_score = self.minimize(maxply,-self.game.side)
-            self.game.board = current_board[:]
-            self.game.side = self.side
-            if not best_score or result_score > best_score:
-                best_score = result_score 
-                best_move = pos
-        return best_move
+        return self.best_root_move(self.search_root(maxply,self.minimize,position=position))
 
-    def ab_maximize(self,ply,side,alpha,beta):
+    def ab_maximize(self,position,ply,alpha,beta):
         """
-        Return the maximum score possible from the current position.
-        Use for playing side's move.
+        Return the maximum score possible from position.
+        Use for playing side's move, the side to move in position.
         """
-        if ply == 0 or self.game.test_end():
-            return self.evaluate_state(side)
-        current_board = self.game.board[:]
-        for pos in self.game.board_range:
-            if self.game.make_move(pos,side) == False:
-                continue
-            self.game.side = side
-            alpha = max(alpha,self.ab_minimize(ply-1,-side,alpha,beta))
-            self.game.board = current_board[:]
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & CLOCK_MASK:
+            self.check_time()
+        if ply == 0 or position.is_over():
+            if self.stats is not None:
+                self.stats.leaves += 1
+            return self.evaluate_state(position,position.side)
+        key = position.key()
+        score, hash_move = self.tt_lookup(key,ply,alpha,beta)
+        if score is not None:
+            return score
+        moves = self.move_order(position,hash_move)
+        if not moves:
+            return self.ab_minimize(position.pass_turn(),ply,alpha,beta)
+        alpha_orig = alpha
+        best_move = None
+        for index, (pos, flips) in enumerate(moves):
+            score = self.ab_minimize(position.play(pos,flips),ply-1,alpha,beta)
+            if score > alpha:
+                alpha = score
+                best_move = pos
             if beta <= alpha:
                 # cutoff triggered
+                if self.stats is not None:
+                    self.stats.cutoff(index)
                 break
+        self.tt_save(key,ply,alpha,alpha_orig,beta,best_move)
         return alpha
 
-    def ab_minimize(self,ply,side,alpha,beta):
+    def ab_minimize(self,position,ply,alpha,beta):
         """
-        Return the lowest score possible from this position.
-        Use for opponent's move.
+        Return the lowest score possible from position.
+        Use for opponent's move, the side to move in position.
         """
-        if ply == 0 or self.game.test_end():
-            return self.evaluate_state(side)
-        current_board = self.game.board[:]
-        for pos in self.game.board_range:
-            if self.game.make_move(pos,side) == False: 
-                continue
-            self.game.side = side
-            beta = min(beta,self.ab_maximize(ply-1,-side,alpha,beta))
-            self.game.board = current_board[:]
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & CLOCK_MASK:
+            self.check_time()
+        if ply == 0 or position.is_over():
+            if self.stats is not None:
+                self.stats.leaves += 1
+            # score from the point of view of the maximizing side
+            return self.evaluate_state(position,-position.side)
+        key = position.key()
+        score, hash_move = self.tt_lookup(key,ply,alpha,beta)
+        if score is not None:
+            return score
+        moves = self.move_order(position,hash_move)
+        if not moves:
+            return self.ab_maximize(position.pass_turn(),ply,alpha,beta)
+        beta_orig = beta
+        best_move = None
+        for index, (pos, flips) in enumerate(moves):
+            score = self.ab_maximize(position.play(pos,flips),ply-1,alpha,beta)
+            if score < beta:
+                beta = score
+                best_move = pos
             if beta <= alpha:
                 # cutoff trigger
+                if self.stats is not None:
+                    self.stats.cutoff(index)
                 break
+        self.tt_save(key,ply,beta,alpha,beta_orig,best_move)
         return beta
 
-    def alphabeta_search(self,maxply):
+    def tt_lookup(self,key,ply,alpha,beta):
+        """
+        Return (score, move) stored in the transposition table for this node.
+        score is None unless the stored result settles the node for (alpha, beta).
+        Scores are only reused at the same remaining depth, so the search
+        returns the same result whatever the table holds.
+        """
+        entry = self.tt.probe(key)
+        if entry is None:
+            return None, None
+        if entry[1] == ply:
+            flag, score = entry[2], entry[3]
+            if flag == tt.EXACT:
+                return min(max(score,alpha),beta), entry[4]
+            if flag == tt.LOWER and score >= beta:
+                return beta, entry[4]
+            if flag == tt.UPPER and score <= alpha:
+                return alpha, entry[4]
+        return None, entry[4]
+
+    def tt_save(self,key,ply,score,alpha,beta,move):
+        """
+        Store the score of a node searched with the window (alpha, beta).
+        """
+        if score <= alpha:
+            self.tt.store(key,ply,tt.UPPER,score,move)
+        elif score >= beta:
+            self.tt.store(key,ply,tt.LOWER,score,move)
+        else:
+            self.tt.store(key,ply,tt.EXACT,score,move)
+
+    def move_order(self,position,hash_move):
+        """
+        Return the legal moves in position as (move, flips), with the hash move (if any) first.
+        """
+        moves = position.moves()
+        if hash_move is not None:
+            for index, move in enumerate(moves):
+                if move[0] == hash_move:
+                    if index:
+                        moves.insert(0, moves.pop(index))
+                    break
+        return moves
+
+    def ab_root_child(self,position,ply):
+        """
+        Return the exact alphabeta score of a root move's reply.
+        """
+        return self.ab_minimize(position,ply,float("-inf"),float("inf"))
+
+    def alphabeta_search(self,maxply,position=None):
+        """
+        Return a move by using a minimax search to maxply levels deep,
+        from position or the game's position.
+        """
+        if self.workers > 1 and OthelloParallel.can_fork():
+            return self.best_root_move(OthelloParallel.search_root(self,maxply,self.workers,position))
+        return self.best_root_move(self.search_root(maxply,self.ab_root_child,position=position))
+
+    def pvs_score(self,position):
+        """
+        Return evaluate_state for the side to move with won and lost games as
+        WIN and -WIN, so principal variation search can use integer null windows.
+        """
+        score = self.evaluate_state(position,position.side)
+        if score == float("inf"):
+            return WIN
+        if score == float("-inf"):
+            return -WIN
+        return score
+
+    def pvs_order(self,position,ply,hash_move):
+        """
+        Return the legal moves in position as (move, flips): the hash move, the killer
+        moves for ply, then the rest by history score and WEIGHTS (corners first, X-squares last).
+        """
+        moves = position.moves()
+        killers = self.killers[ply] if ply < len(self.killers) else []
+        history = self.history
+        def rank(move):
+            pos = move[0]
+            if pos == hash_move:
+                return (0,)
+            if pos in killers:
+                return (1, killers.index(pos))
+            return (2, -history[pos], -WEIGHTS[pos])
+        moves.sort(key=rank)
+        return moves
+
+    def pvs(self,position,ply,alpha,beta):
+        """
+        Return the score of position for the side to move, searched ply plies deep.
+        Scores outside (alpha, beta) only give a bound, like ab_maximize.
+        The first move gets the full window, the others a null window that is
+        widened only when they turn out better.
+        """
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & CLOCK_MASK:
+            self.check_time()
+        if ply == 0 or position.is_over():
+            if self.stats is not None:
+                self.stats.leaves += 1
+            return self.pvs_score(position)
+        key = position.key()
+        score, hash_move = self.tt_lookup(key,ply,alpha,beta)
+        if score is not None:
+            return score
+        moves = self.pvs_order(position,ply,hash_move)
+        if not moves:
+            return -self.pvs(position.pass_turn(),ply,-beta,-alpha)
+        alpha_orig = alpha
+        best_move = None
+        for index, (pos, flips) in enumerate(moves):
+            child = position.play(pos,flips)
+            if index == 0:
+                score = -self.pvs(child,ply-1,-beta,-alpha)
+            else:
+                score = -self.pvs(child,ply-1,-alpha-1,-alpha)
+                if alpha < score < beta:
+                    score = -self.pvs(child,ply-1,-beta,-alpha)
+            if score > alpha:
+                alpha = score
+                best_move = pos
+            if beta <= alpha:
+                killers = self.killers[ply]
+                if pos not in killers:
+                    killers.insert(0, pos)
+                    del killers[KILLERS:]
+                self.history[pos] += ply * ply
+                if self.stats is not None:
+                    self.stats.cutoff(index)
+                break
+        self.tt_save(key,ply,alpha,alpha_orig,beta,best_move)
+        return alpha
+
+    def pvs_search(self,maxply,position=None):
+        """
+        Return the move alphabeta_search(maxply) would, found with principal variation
+        search from position or the game's position.
+        Root moves are tried best first, each later one only proving with a null
+        window whether it beats the best so far (or ties it from earlier in
+        board_range order, as best_root_move breaks ties).
+        """
+        position = self.search_position(position)
+        key = position.key()
+        entry = self.tt.peek(key)
+        self.killers = [[] for ply in range(maxply+1)]
+        # older cutoffs count for less
+        self.history = [score // 2 for score in self.history]
+        moves = self.pvs_order(position,maxply+1,entry[4] if entry is not None else None)
+        board_order = dict((pos, index) for index, pos in enumerate(sorted(pos for pos, flips in moves)))
+        best_move = None
+        for pos, flips in moves:
+            child = position.play(pos,flips)
+            if best_move is None:
+                best_score = -self.pvs(child,maxply,-WIN,WIN)
+                best_move = pos
+            else:
+                # an earlier move only has to tie
+                bound = best_score
+                if board_order[pos] < board_order[best_move]:
+                    bound -= 1
+                score = -self.pvs(child,maxply,-bound-1,-bound)
+                if score > bound:
+                    score = -self.pvs(child,maxply,-WIN,-bound)
+                    if score > bound:
+                        best_score = score
+                        best_move = pos
+        if best_move is not None:
+            self.tt.store(key,maxply+1,tt.EXACT,best_score,best_move)
+        return best_move
+
+    def pvs_deepening(self,time_budget):
         """
-        Return a move by using a minimax search to maxply levels deep.
+        Return a move by principal variation searches 1, 2, 3... plies deep within
+        time_budget seconds, like deepening_search. Each search starts
+        with the previous one's best move, kept in the transposition table.
+        """
+        position = self.search_position()
+        legal = position.moves()
+        best_move = legal[0][0]
+        maxply = 0
+        times = []
+        self.deadline = budget_deadline(time.time(),time_budget)
+        try:
+            while True:
+                start = time.time()
+                best_move = self.pvs_search(maxply,position)
+                times.append(time.time() - start)
+                self.last_depth = maxply
+                if self.stats is not None:
+                    self.stats.ply_done(self,maxply)
+                if maxply+1 >= position.empty_count:
+                    break
+                if not self.deeper_search_fits(times,len(legal)):
+                    break
+                maxply += 1
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        return best_move
+
+    def mcts_search(self,time_budget=None,playouts=None):
+        """
+        Return a move found by Monte Carlo tree search, stopping after playouts
+        playouts or time_budget seconds. Without either, self.playouts or
+        MCTS_PLAYOUTS playouts.
+        """
+        deadline = None
+        if time_budget is not None:
+            deadline = budget_deadline(time.time(),time_budget)
+        elif playouts is None:
+            playouts = self.playouts or MCTS_PLAYOUTS
+        own, opp = self.game.bits(self.side)
+        bit = self.mcts.search(own,opp,playouts,deadline)
+        self.last_playouts = self.mcts.playouts
+        # every playout adds one node to the tree
+        self.nodes += self.mcts.playouts
+        if self.stats is not None:
+            self.stats.leaves += self.mcts.playouts
+        return bb.BIT_TO_SQUARE[bit]
+
+    def search_root(self,maxply,child_search,moves=None,position=None):
+        """
+        Return a list of (score, move) for the legal moves of the side to move
+        in position (the game's position if None), scoring each with
+        child_search(position after the move, maxply).
+        moves gives the order to try them in, default is board_range order.
+        """
+        position = self.search_position(position)
+        legal = position.moves()
+        if moves is not None:
+            by_move = dict(legal)
+            legal = [(pos, by_move[pos]) for pos in moves if pos in by_move]
+        results = []
+        for pos, flips in legal:
+            results.append((child_search(position.play(pos,flips),maxply),pos))
+        return results
+
+    def best_root_move(self,results):
+        """
+        Return the move with the highest score, the earliest one on ties.
         """
-        current_board = self.game.board[:]
         best_score = None
-        for pos in self.game.board_range:
-            if self.game.make_move(pos,self.game.side) == False:
-                continue
-            result_score = self.ab_minimize(maxply,-self.game.side,float("-inf"),float("inf"))
-            self.game.board = current_board[:]
-            self.game.side = self.side
-            if not best_score or result_score > best_score:
-                best_score = result_score 
+        for result_score, pos in results:
+            if best_score is None or result_score > best_score:
+                best_score = result_score
                 best_move = pos
         return best_move
 
-    def find_move(self):
+    def check_time(self):
+        """
+        Raise SearchTimeout if the deadline for this move has passed or self.stop is set.
+        """
+        if time.time() >= self.deadline or (self.stop is not None and self.stop.is_set()):
+            raise SearchTimeout()
+
+    def deeper_search_fits(self,times,branching):
+        """
+        Return True if a search one ply deeper than the last is expected to end
+        before self.deadline. It should take the last search's time (the last of
+        times) times the growth from the one before, or times branching after one search.
+        """
+        growth = branching
+        if len(times) > 1 and times[-2] > 0:
+            growth = times[-1] / times[-2]
+        return time.time() + times[-1] * growth < self.deadline
+
+    def deepening_search(self,child_search,time_budget):
+        """
+        Return a move by searching 1, 2, 3... plies deep within time_budget seconds,
+        stopping early once the next search is not expected to finish in time.
+        The move comes from the deepest search that finished, and every search
+        tries the root moves in order of the previous search's scores.
+        """
+        position = self.search_position()
+        legal = position.moves()
+        # played if not even the 1 ply search finishes
+        best_move = legal[0][0]
+        moves = None
+        maxply = 0
+        times = []
+        self.deadline = budget_deadline(time.time(),time_budget)
+        try:
+            while True:
+                start = time.time()
+                results = self.search_root(maxply,child_search,moves,position)
+                best_move = self.best_root_move(results)
+                times.append(time.time() - start)
+                self.last_depth = maxply
+                if self.stats is not None:
+                    self.stats.ply_done(self,maxply)
+                if maxply+1 >= position.empty_count:
+                    # searched to the end of the game, deeper would not change anything
+                    break
+                if not self.deeper_search_fits(times,len(legal)):
+                    break
+                # best first, earlier moves first on ties
+                moves = [pos for result_score, pos in sorted(results, key=lambda r: -r[0])]
+                maxply += 1
+        except SearchTimeout:
+            # the aborted search only made positions of its own, nothing to undo
+            pass
+        finally:
+            self.deadline = None
+        return best_move
+
+    def book_move(self):
+        """
+        Return the opening book's move for the current position, or None.
+        """
+        entry = self.book.lookup(self.game.position_key(self.side))
+        if entry is None or not self.game.legal_move(entry[0],self.side):
+            return None
+        return entry[0]
+
+    def endgame_move(self,deadline=None,position=None):
+        """
+        Return the move with the best final disc difference, found by the endgame
+        solver in position or the game's position.
+        Return None if the solver does not finish before deadline.
+        """
+        if position is None:
+            position = self.game.position
+        own, opp = position.bits(position.side)
+        try:
+            bit, score = self.solver.best_move(own,opp,deadline)
+        except OthelloEndgame.EndgameTimeout:
+            return None
+        return bb.BIT_TO_SQUARE[bit]
+
+    def principal_variation(self,move,length):
+        """
+        Return the expected line of play starting with move, at most length moves,
+        following the best moves stored in the transposition table.
+        """
+        pv = []
+        position = self.search_position()
+        while move is not None and len(pv) < length:
+            position = position.play(move)
+            if position is None:
+                # a stale entry from another position in the same bucket
+                break
+            pv.append(move)
+            if not position.is_over() and not position.has_moves(position.side):
+                position = position.pass_turn()
+            entry = self.tt.peek(position.key())
+            move = entry[4] if entry is not None else None
+        return pv
+
+    def planned_search(self,position=None):
+        """
+        Return (source, depth) of the search choose_move makes for minimax,
+        alphabeta and PVS in position (the game's position if None) without a time budget.
+        """
+        if position is None:
+            position = self.game.position
+        emptys = position.empty_count
+        if emptys <= self.endgame_empties:
+            return "endgame", emptys - 1
+        source = {MINIMAX: "minimax", ALPHABETA: "alphabeta", PVS: "pvs"}[self.strat]
+        if emptys < 8:
+            return source, emptys
+        return source, 3
+
+    def start_pondering(self):
+        """
+        Start searching, in a background thread, the positions after each reply
+        of the opponent, who is to move now. Does nothing unless self.ponder
+        is set and the strategy is minimax, alphabeta or PVS.
+        Call stop_pondering once the opponent has moved, find_move then uses
+        whatever was found.
+        """
+        if not self.ponder or self.strat not in (MINIMAX, ALPHABETA, PVS) or self.ponder_thread is not None:
+            return
+        self.ponder_cache = {}
+        self.ponder_stop = threading.Event()
+        self.ponder_thread = threading.Thread(target=self.ponder_replies,
+                                              args=(self.search_position(),self.ponder_stop))
+        self.ponder_thread.daemon = True
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        """
+        Stop the pondering thread and wait for it.
+        """
+        if self.ponder_thread is None:
+            return
+        self.ponder_stop.set()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+
+    def ponder_replies(self,position,stop):
+        """
+        Fill self.ponder_cache with the move choose_move would make after each of
+        the opponent's replies in position, likeliest replies first, until stop is set.
+        The searches share self.tt, so even an unfinished one speeds up the next move.
+        """
+        # searches only read the game, so the searcher can share it
+        searcher = OthelloAI(self.game,self.side,self.strat,tt_size=self.tt.size,
+                             endgame_empties=self.endgame_empties,evaluation=self.evaluation,
+                             pattern_file=self.pattern_file)
+        searcher.tt = self.tt
+        searcher.stop = searcher.solver.stop = stop
+        # never times out, only stops
+        searcher.deadline = float("inf")
+        opponent = -self.side
+        replies = []
+        for pos, flips in position.legal_moves(opponent):
+            after = position.play(pos,flips)
+            # the replies that look best for the opponent straight away come first
+            replies.append((-opponent * after.weight_score, pos, after))
+        replies.sort(key=lambda reply: reply[:2])
+        try:
+            for score, pos, after in replies:
+                if not after.is_over() and after.has_moves(self.side):
+                    source, depth = searcher.planned_search(after)
+                    if source == "endgame":
+                        move = searcher.endgame_move(searcher.deadline,after)
+                        if move is None:
+                            break
+                    elif source == "minimax":
+                        move = searcher.minimax_search(depth,after)
+                    elif source == "pvs":
+                        move = searcher.pvs_search(depth,after)
+                    else:
+                        move = searcher.alphabeta_search(depth,after)
+                    self.ponder_cache[after.key()] = (source, depth, move)
+        except SearchTimeout:
+            pass
+
+    def find_move(self,time_budget=None):
+        """
+        Return a move chosen by choose_move, keeping a record of the search
+        in self.stats if there is one.
+        """
+        if self.stats is None:
+            return self.choose_move(time_budget)
+        key = self.game.position_key(self.side)
+        empties = self.game.empty_count
+        self.stats.start_move(self)
+        move = self.choose_move(time_budget)
+        pv = [move]
+        if self.last_source in ("alphabeta", "pvs") and self.last_depth is not None:
+            pv = self.principal_variation(move,self.last_depth+1)
+        self.stats.end_move(self,move,key,empties,pv)
+        return move
+
+    def choose_move(self,time_budget=None):
         """
         Return a move by implementing a strategy determined by the attribute self.strat
         First three moves are random if self.board_start is set
+        With a time_budget (or self.time_budget) minimax, alphabeta and PVS search
+        deeper and deeper within that many seconds
+        Sets self.last_source and self.last_depth to how the move was found
         """
+        start = time.time()
         self.move_count+=1
+        self.last_source = "random"
+        self.last_depth = None
+        self.last_playouts = None
+        if time_budget is None:
+            time_budget = self.time_budget
         if self.board_start == "random" and self.move_count <= 5:
             return self.random_strat()
         if self.strat == RANDOM:
             return self.random_strat()
-        elif self.strat == SHALLOW:
+        if self.book is not None:
+            move = self.book_move()
+            if move is not None:
+                self.last_source = "book"
+                return move
+        if self.strat in (MINIMAX, ALPHABETA, PVS):
+            pondered = self.ponder_cache.get(self.game.position_key(self.side))
+            # a pondered deepening search would not match, but it filled the transposition table
+            if pondered is not None and pondered[:2] == self.planned_search() and \
+                    (time_budget is None or pondered[0] == "endgame") and \
+                    self.game.legal_move(pondered[2],self.side):
+                self.last_source, self.last_depth, move = pondered
+                return move
+        if self.strat in (MINIMAX, ALPHABETA, PVS) and self.game.empty_count <= self.endgame_empties:
+            deadline = None
+            if time_budget is not None:
+                # keep half the time for a normal search in case the solver does not finish
+                deadline = budget_deadline(start,time_budget/2.0)
+            move = self.endgame_move(deadline)
+            if move is not None:
+                self.last_source = "endgame"
+                self.last_depth = self.game.empty_count - 1
+                return move
+        if time_budget is not None:
+            # the book, the pondered moves and the solver used some of it
+            time_budget -= time.time() - start
+        if self.strat == SHALLOW:
+            self.last_source = "shallow"
+            self.last_depth = 0
             return self.shallow_search()
         elif self.strat == MINIMAX:
+            self.last_source = "minimax"
+            if time_budget is not None:
+                return self.deepening_search(self.minimize,time_budget)
             # count the number of empty squares
-            emptys = sum([1 for i in self.game.board_range if self.game.board[i] == self.game.EMPTY])
+            emptys = self.game.empty_count
             # return self.minimax_search(1)
             if emptys < 8:
                 # search to the end of the game
+                self.last_depth = emptys
                 return self.minimax_search(emptys)
             #else:
+            self.last_depth = 3
             return self.minimax_search(3)
         elif self.strat == ALPHABETA:
-            emptys = sum([1 for i in self.game.board_range if self.game.board[i] == self.game.EMPTY])
+            self.last_source = "alphabeta"
+            if time_budget is not None:
+                return self.deepening_search(self.ab_root_child,time_budget)
+            emptys = self.game.empty_count
             if emptys < 8:
+                self.last_depth = emptys
                 return self.alphabeta_search(emptys)
             #else:
+            self.last_depth = 3
             return self.alphabeta_search(3)
+        elif self.strat == PVS:
+            self.last_source = "pvs"
+            if time_budget is not None:
+                return self.pvs_deepening(time_budget)
+            emptys = self.game.empty_count
+            if emptys < 8:
+                self.last_depth = emptys
+                return self.pvs_search(emptys)
+            self.last_depth = 3
+            return self.pvs_search(3)
+        elif self.strat == MCTS:
+            self.last_source = "mcts"
+            return self.mcts_search(time_budget)
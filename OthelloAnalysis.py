@@ -0,0 +1,292 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Batch position analysis for the Othello AI
+Reads positions, one per line as the 64 characters of GameBoard.load_position
+and the side to move, searches each with a strategy and depth in a process
+pool and writes one JSON object per position. Results are kept in an
+SQLite file keyed by position hash, strategy, depth and evaluation, so
+running the same positions again only searches the new ones
+Peter Elmers
+"""
+
+import Othello
+import OthelloAI as ai
+import OthelloBitboard as bb
+import argparse, json, multiprocessing, sqlite3, sys, time
+
+STRATEGIES = ["minimax", "alphabeta", "pvs", "endgame"]
+# positions looked up, searched and written together, which bounds memory use
+BATCH_SIZE = 256
+DEFAULT_CACHE = "analysis.sqlite"
+# names of the side to move accepted after the board
+SIDES = {'X': Othello.BLACK, 'B': Othello.BLACK, 'BLACK': Othello.BLACK, '-1': Othello.BLACK,
+         'O': Othello.WHITE, 'W': Othello.WHITE, 'WHITE': Othello.WHITE, '1': Othello.WHITE}
+
+def parse_position(line):
+    """
+    Return (board, side) of a line holding the 64 squares of a position
+    (as GameBoard.load_position reads them, whitespace allowed) and then the
+    side to move: X, B, black or -1 for black, O, W, white or 1 for white.
+    Raise ValueError if the line is not a position.
+    """
+    fields = line.split()
+    if len(fields) < 2:
+        raise ValueError("a position needs its squares and the side to move")
+    side = SIDES.get(fields[-1].upper())
+    if side is None:
+        raise ValueError("unknown side to move %r" % fields[-1])
+    game = Othello.GameBoard()
+    game.load_position(''.join(fields[:-1]), side)
+    return game.position_string(), side
+
+def _score(score):
+    # won and lost games come out of the searches as infinities, which JSON lacks
+    if score == float("inf"):
+        return ai.WIN
+    if score == float("-inf"):
+        return -ai.WIN
+    return score
+
+def analyse(board, side, strategy, depth, ai_options=None):
+    """
+    Return a dictionary of the best move (None when the side to move must pass
+    or the game is over), its score for the side to move, nodes and seconds
+    of one position searched with strategy to depth.
+    Scores are WEIGHTS points (or the pattern evaluation) for the searches,
+    ai.WIN for a won game, and the final disc difference for the endgame
+    solver and finished games.
+    Raise ValueError for an endgame solve of more empty squares than the
+    endgame_empties of ai_options (ai.ENDGAME_EMPTIES by default), which
+    could take hours.
+    """
+    game = Othello.GameBoard(engine=(ai_options or {}).get('engine', 'list'))
+    options = dict(ai_options or {})
+    options.pop('engine', None)
+    game.load_position(board, side)
+    strat = {"minimax": ai.MINIMAX, "alphabeta": ai.ALPHABETA, "pvs": ai.PVS,
+             "endgame": ai.ALPHABETA}[strategy]
+    searcher = ai.OthelloAI(game, side, strat, **options)
+    start = time.time()
+    position = game.position
+    sign = 1
+    move = None
+    if position.is_over() or not (position.has_moves(side) or position.has_moves(-side)):
+        score = side * (position.white_count - position.black_count)
+    else:
+        if not position.has_moves(side):
+            # the move is a pass, the search is of the opponent's reply
+            position = position.pass_turn()
+            sign = -1
+        if strategy == "endgame":
+            if position.empty_count > searcher.endgame_empties:
+                raise ValueError("%i empty squares are too many to solve, the limit is %i" % (
+                    position.empty_count, searcher.endgame_empties))
+            own, opp = position.bits(position.side)
+            bit, score = searcher.solver.best_move(own, opp)
+            move = bb.BIT_TO_SQUARE[bit]
+        elif strategy == "pvs":
+            move = searcher.pvs_search(depth, position)
+            # pvs_search leaves the root's exact score in the transposition table
+            score = searcher.tt.peek(position.key())[3]
+        else:
+            child_search = searcher.minimize if strategy == "minimax" else searcher.ab_root_child
+            results = searcher.search_root(depth, child_search, position=position)
+            move = searcher.best_root_move(results)
+            score = _score(max(result_score for result_score, pos in results))
+        score *= sign
+        if sign < 0:
+            move = None
+    return {'move': move, 'score': score, 'nodes': searcher.nodes + searcher.solver.nodes,
+            'seconds': time.time() - start}
+
+def _analyse_task(task):
+    """
+    Return analyse(*task), or a dictionary of the error that stopped it. Runs in a pool worker.
+    """
+    try:
+        return analyse(*task)
+    except ValueError as error:
+        return {'error': str(error)}
+    except Exception as error:
+        return {'error': repr(error)}
+
+def _signed(key):
+    # SQLite integers are signed 64 bit
+    return key - 2**64 if key >= 2**63 else key
+
+class ResultCache(object):
+    """
+    SQLite store of analysis results, keyed by position hash (with side to move),
+    strategy, depth and evaluation. The board is stored too and checked on
+    lookup, so a hash collision is a miss rather than a wrong answer.
+    """
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS analysis ("
+            "key INTEGER, strategy TEXT, depth INTEGER, evaluation TEXT, board TEXT, side INTEGER, "
+            "move INTEGER, score REAL, nodes INTEGER, seconds REAL, "
+            "PRIMARY KEY (key, strategy, depth, evaluation))")
+        self.connection.commit()
+
+    def lookup(self, key, board, strategy, depth, evaluation):
+        """
+        Return the stored result of a position, or None.
+        """
+        row = self.connection.execute(
+            "SELECT board, move, score, nodes, seconds FROM analysis "
+            "WHERE key = ? AND strategy = ? AND depth = ? AND evaluation = ?",
+            (_signed(key), strategy, depth, evaluation)).fetchone()
+        if row is None or row[0] != board:
+            return None
+        score = row[2]
+        if score == int(score):
+            score = int(score)
+        return {'move': row[1], 'score': score, 'nodes': row[3], 'seconds': row[4]}
+
+    def store(self, key, board, side, strategy, depth, evaluation, result):
+        """
+        Keep the result of a position, replacing any older one. Call commit to write it.
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO analysis VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (_signed(key), strategy, depth, evaluation, board, side, result['move'], result['score'],
+             result['nodes'], result['seconds']))
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+def analyse_lines(lines, strategy="alphabeta", depth=4, workers=1, cache=None, ai_options=None,
+                  refresh=False):
+    """
+    Yield a result dictionary for every non-empty line of lines that does not
+    start with '#', in order: line (number), board, side, move, score, nodes,
+    seconds and cached, or line and error for lines that are not positions.
+    Positions are looked up in cache (a ResultCache) unless refresh is set,
+    and the others searched in workers processes and stored in cache.
+    """
+    ai_options = ai_options or {}
+    evaluation = ai_options.get('evaluation', 'weights')
+    if ai_options.get('pattern_file'):
+        evaluation += ':' + ai_options['pattern_file']
+    # depth does not change an exact solve
+    if strategy == "endgame":
+        depth = 0
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        batch = []
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            batch.append((number, line))
+            if len(batch) == BATCH_SIZE:
+                for result in _analyse_batch(batch, strategy, depth, evaluation, pool, cache,
+                                             ai_options, refresh):
+                    yield result
+                batch = []
+        for result in _analyse_batch(batch, strategy, depth, evaluation, pool, cache,
+                                     ai_options, refresh):
+            yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def _analyse_batch(batch, strategy, depth, evaluation, pool, cache, ai_options, refresh):
+    """
+    Return the results of a batch of (line number, line), see analyse_lines.
+    """
+    results = []
+    tasks = []
+    keys = {}
+    for number, line in batch:
+        try:
+            board, side = parse_position(line)
+        except ValueError as error:
+            results.append({'line': number, 'error': str(error)})
+            continue
+        game = Othello.GameBoard()
+        game.load_position(board, side)
+        key = game.position.key()
+        result = {'line': number, 'board': board, 'side': side}
+        found = None
+        if cache is not None and not refresh:
+            found = cache.lookup(key, board, strategy, depth, evaluation)
+        if found is not None:
+            result.update(found)
+            result['cached'] = True
+        else:
+            keys[len(results)] = key
+            tasks.append((board, side, strategy, depth, ai_options))
+        results.append(result)
+    if tasks:
+        if pool is not None:
+            found = pool.map(_analyse_task, tasks, 1)
+        else:
+            found = [_analyse_task(task) for task in tasks]
+        searched = iter(found)
+        for index, result in enumerate(results):
+            if index not in keys:
+                continue
+            found = next(searched)
+            result.update(found)
+            if 'error' not in found:
+                result['cached'] = False
+                if cache is not None:
+                    cache.store(keys[index], result['board'], result['side'], strategy, depth,
+                                evaluation, found)
+        if cache is not None:
+            cache.commit()
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Analyse Othello positions, writing JSON lines.")
+    parser.add_argument("input", help="file of positions, one per line: 64 squares and the side to move, "
+                                      "- for standard input")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="alphabeta")
+    parser.add_argument("--depth", type=int, default=4, help="plies searched below each move")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="SQLite file of earlier results")
+    parser.add_argument("--no-cache", action="store_true", help="neither read nor write the cache")
+    parser.add_argument("--refresh", action="store_true", help="search again and replace cached results")
+    parser.add_argument("--engine", choices=["list", "bitboard"], default="list")
+    parser.add_argument("--evaluation", choices=["weights", "pattern"], default="weights",
+                        help="how the searches score positions")
+    parser.add_argument("--patterns", help="pattern table file for --evaluation pattern")
+    parser.add_argument("--endgame-empties", type=int, default=ai.ENDGAME_EMPTIES,
+                        help="most empty squares --strategy endgame solves, positions with more "
+                             "get an error (default: %(default)s)")
+    parser.add_argument("--output", help="file to write the results to instead of standard output")
+    args = parser.parse_args(argv)
+    ai_options = {'engine': args.engine}
+    if args.endgame_empties != ai.ENDGAME_EMPTIES:
+        ai_options['endgame_empties'] = args.endgame_empties
+    if args.evaluation != "weights":
+        ai_options['evaluation'] = args.evaluation
+    if args.patterns:
+        ai_options['pattern_file'] = args.patterns
+    cache = None if args.no_cache else ResultCache(args.cache)
+    lines = sys.stdin if args.input == '-' else open(args.input)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for result in analyse_lines(lines, args.strategy, args.depth, args.workers, cache,
+                                    ai_options, args.refresh):
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+            output.flush()
+    finally:
+        if cache is not None:
+            cache.close()
+        if lines is not sys.stdin:
+            lines.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Batch engine for the Othello board game, written with NumPy
+Plays many games in lockstep, one uint64 bitboard per side per game,
+for the random and shallow (1-ply) strategies
+Peter Elmers
+"""
+
+import OthelloAI as ai
+import OthelloBitboard as bb
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_BATCH = 4096
+
+if np is not None:
+    _U = np.uint64
+    _FULL = _U(bb.FULL)
+    _ZERO = _U(0)
+    _BYTE = _U(0xFF)
+    # (shift amount, shifts left, mask) for each direction
+    _DIRECTIONS = [(_U(abs(amount)), amount > 0, _U(mask)) for amount, mask in bb.DIRECTIONS]
+    _BYTE_SHIFTS = [_U(8*row) for row in range(8)]
+    _BITS = np.left_shift(_U(1), np.arange(64, dtype=np.uint64))
+    # per row of the board: popcount and weight sum of every byte value
+    _POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int64)
+    _ROW_WEIGHTS = np.array([[sum(ai.WEIGHTS[bb.BIT_TO_SQUARE[row*8 + col]]
+                                  for col in range(8) if byte >> col & 1)
+                              for byte in range(256)] for row in range(8)], dtype=np.int64)
+    _BIT_WEIGHTS = np.array([ai.WEIGHTS[pos] for pos in bb.BIT_TO_SQUARE], dtype=np.int64)
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("the batch engine needs NumPy")
+
+def _shift(bits, amount, left, mask):
+    if left:
+        return (bits << amount) & mask
+    return (bits >> amount) & mask
+
+def popcount(bits):
+    """
+    Return the number of discs in each bitboard of an array.
+    """
+    total = np.zeros(bits.shape, dtype=np.int64)
+    for amount in _BYTE_SHIFTS:
+        total += _POPCOUNT[((bits >> amount) & _BYTE).astype(np.intp)]
+    return total
+
+def weight_sum(bits):
+    """
+    Return the sum of OthelloAI.WEIGHTS over the discs of each bitboard of an array.
+    """
+    total = np.zeros(bits.shape, dtype=np.int64)
+    for row, amount in enumerate(_BYTE_SHIFTS):
+        total += _ROW_WEIGHTS[row][((bits >> amount) & _BYTE).astype(np.intp)]
+    return total
+
+def move_masks(own, opp):
+    """
+    Return the legal move bitboard of own for every game.
+    """
+    empty = ~(own | opp)
+    legal = np.zeros(own.shape, dtype=np.uint64)
+    for amount, left, mask in _DIRECTIONS:
+        opp_mask = opp & mask
+        run = _shift(own, amount, left, opp_mask)
+        for i in range(5):
+            run |= _shift(run, amount, left, opp_mask)
+        legal |= _shift(run, amount, left, mask) & empty
+    return legal
+
+def flip_masks(own, opp, moves):
+    """
+    Return the discs flipped by own playing the single-bit moves, for every game.
+    Games whose move is 0 flip nothing.
+    """
+    flipped = np.zeros(own.shape, dtype=np.uint64)
+    for amount, left, mask in _DIRECTIONS:
+        # run of opponent discs next to the move, then check it ends on an own disc
+        run = _shift(moves, amount, left, mask) & opp
+        for i in range(5):
+            run |= _shift(run, amount, left, mask) & opp
+        capped = (_shift(run, amount, left, mask) & own) != _ZERO
+        flipped |= np.where(capped, run, _ZERO)
+    return flipped
+
+def _random_moves(legal, rng):
+    """
+    Return one uniformly chosen legal move (as a bit) per game.
+    """
+    is_legal = (legal[:, None] & _BITS) != _ZERO
+    keys = np.where(is_legal, rng.random_sample(is_legal.shape), -1.0)
+    return _BITS[keys.argmax(axis=1)]
+
+def _shallow_moves(own, opp, legal):
+    """
+    Return the move each game's shallow searcher would pick.
+    Like OthelloAI.shallow_search: best weight score after the move,
+    a finished game scores as a win or loss, ties go to the highest square.
+    """
+    count = len(own)
+    own_all = np.repeat(own, 64)
+    opp_all = np.repeat(opp, 64)
+    moves_all = np.tile(_BITS, count)
+    flipped = flip_masks(own_all, opp_all, moves_all).reshape(count, 64)
+    scores = (weight_sum(own) - weight_sum(opp))[:, None] + _BIT_WEIGHTS[None, :] + 2*weight_sum(flipped)
+    scores = scores.astype(np.float64)
+    # the move that fills the board ends the game
+    flip_counts = popcount(flipped)
+    own_count = popcount(own)[:, None] + flip_counts + 1
+    opp_count = popcount(opp)[:, None] - flip_counts
+    filling = popcount(own | opp) == 63
+    scores = np.where(filling[:, None] & (own_count > opp_count), np.inf, scores)
+    scores = np.where(filling[:, None] & (own_count < opp_count), -np.inf, scores)
+    is_legal = (legal[:, None] & _BITS) != _ZERO
+    scores = np.where(is_legal, scores, -np.inf)
+    best = scores.max(axis=1)
+    # highest square among the best legal moves, like shallow_search
+    ties = (scores == best[:, None]) & is_legal
+    pick = 63 - np.argmax(ties[:, ::-1], axis=1)
+    return _BITS[pick]
+
+def play_batch(white_source, black_source, games, starting_board="default", rng=None):
+    """
+    Play games games in lockstep and return the final (black, white) bitboard arrays.
+    Sources are ai.RANDOM or ai.SHALLOW.
+    With starting_board "random" each player's first 5 moves are random, like OthelloAI.
+    """
+    _require_numpy()
+    for source in (white_source, black_source):
+        if source not in (ai.RANDOM, ai.SHALLOW):
+            raise ValueError("the batch engine only plays the random and shallow strategies")
+    if rng is None:
+        rng = np.random.RandomState()
+    black = np.full(games, _U(1 << bb.SQUARE_TO_BIT[45] | 1 << bb.SQUARE_TO_BIT[54]), dtype=np.uint64)
+    white = np.full(games, _U(1 << bb.SQUARE_TO_BIT[44] | 1 << bb.SQUARE_TO_BIT[55]), dtype=np.uint64)
+    black_to_move = np.ones(games, dtype=bool)
+    unplayed = np.zeros(games, dtype=np.int64)
+    move_counts = {True: np.zeros(games, dtype=np.int64), False: np.zeros(games, dtype=np.int64)}
+    done = np.zeros(games, dtype=bool)
+    while True:
+        # same order as GameBoard.play_turn: end test, pass, then move
+        done |= (unplayed >= 2) | ((black | white) == _FULL)
+        if done.all():
+            break
+        own = np.where(black_to_move, black, white)
+        opp = np.where(black_to_move, white, black)
+        legal = move_masks(own, opp)
+        passing = ~done & (legal == _ZERO)
+        playing = ~done & (legal != _ZERO)
+        unplayed[passing] += 1
+        unplayed[playing] = 0
+        for is_black, source in ((True, black_source), (False, white_source)):
+            index = np.nonzero(playing & (black_to_move == is_black))[0]
+            if len(index) == 0:
+                continue
+            move_counts[is_black][index] += 1
+            random_mask = np.ones(len(index), dtype=bool)
+            if source == ai.SHALLOW:
+                random_mask[:] = False
+                if starting_board == "random":
+                    random_mask = move_counts[is_black][index] <= 5
+            moves = np.zeros(len(index), dtype=np.uint64)
+            if random_mask.any():
+                moves[random_mask] = _random_moves(legal[index][random_mask], rng)
+            if not random_mask.all():
+                rest = ~random_mask
+                moves[rest] = _shallow_moves(own[index][rest], opp[index][rest], legal[index][rest])
+            flipped = flip_masks(own[index], opp[index], moves)
+            new_own = own[index] | flipped | moves
+            new_opp = opp[index] & ~flipped
+            if is_black:
+                black[index], white[index] = new_own, new_opp
+            else:
+                white[index], black[index] = new_own, new_opp
+        black_to_move = np.where(done, black_to_move, ~black_to_move)
+    return black, white
+
+def simulate(white_source, black_source, sim_number, starting_board="default", seed=0,
+             batch_size=DEFAULT_BATCH):
+    """
+    Play sim_number games with the batch engine and return the same
+    statistics dictionary as Othello.simulate.
+    Games use NumPy's random generator, so they differ from Othello.simulate's.
+    """
+    _require_numpy()
+    rng = np.random.RandomState(seed)
+    stats = {'games': sim_number, 'black_wins': 0, 'white_wins': 0, 'draws': 0,
+             'black_discs': 0, 'white_discs': 0}
+    Start = time.time()
+    for first in range(0, sim_number, batch_size):
+        black, white = play_batch(white_source, black_source, min(batch_size, sim_number-first),
+                                  starting_board, rng)
+        blacks = popcount(black)
+        whites = popcount(white)
+        stats['black_wins'] += int((blacks > whites).sum())
+        stats['white_wins'] += int((whites > blacks).sum())
+        stats['draws'] += int((whites == blacks).sum())
+        stats['black_discs'] += int(blacks.sum())
+        stats['white_discs'] += int(whites.sum())
+    stats['seconds'] = time.time() - Start
+    return stats
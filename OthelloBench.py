@@ -0,0 +1,280 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Benchmark suite for the Othello engines and AI
+Counts perft nodes from the start position, times each search strategy
+on fixed positions, counts the positions and bytes the searches allocate
+and writes the results as JSON to compare across commits
+Peter Elmers
+"""
+
+import Othello
+import OthelloAI as ai
+import OthelloBitboard as bb
+import OthelloPosition
+import argparse, json, platform, random, sys, time
+
+# leaf counts of the full game tree from the start position, passes count as a move
+PERFT_COUNTS = [1, 4, 12, 56, 244, 1396, 8200, 55092, 390216, 3005288, 24571284]
+
+# (name, position for GameBoard.load_position, side to move)
+MIDGAME_POSITIONS = [
+    ('mid40', '----O---' 'O---O---' '-OOOO---' '--OOO-X-'
+              '-OOOOX--' '--OOO---' '---XOO--' '--X---O-', Othello.BLACK),
+    ('mid36', 'O-X-----' '-O-XO---' 'XOOXXXXX' '-O-OXOX-'
+              '-O-OXX--' '--O-XXX-' '-----XO-' '--------', Othello.BLACK),
+    ('mid30', 'O----O--' '-O---OX-' '-XOOXX--' 'OOXOXXXX'
+              '--XXOXO-' '---OXOX-' '--OOOX--' '---O-XO-', Othello.BLACK),
+    ('mid20', 'X-O-OOO-' 'XOOOX---' 'XOOOOOOO' 'XXXXXOXX'
+              '-OOOOX--' 'O-OOOXX-' '-O-XXXX-' '--X---O-', Othello.BLACK),
+]
+ENDGAME_POSITIONS = [
+    ('end14', 'OOOOX---' '-OOOXX--' 'XOXOOXXX' 'XXOXOOXX'
+              '-XXXXOOX' 'OXXXXOOO' '-X-X-XO-' '--X-XOOO', Othello.BLACK),
+    ('end10', 'O---OOO-' 'XXXXOOOO' 'XXXOOX--' 'OOXOOXXX'
+              '-OOXOXX-' 'XOOXXOXX' '-OXOXXOX' '-OOOOOOO', Othello.BLACK),
+]
+
+# (name, strategy, depth) timed on every position
+SEARCHES = [('shallow', ai.SHALLOW, 1), ('minimax', ai.MINIMAX, 3), ('alphabeta', ai.ALPHABETA, 4),
+            ('pvs', ai.PVS, 4)]
+# playouts of the Monte Carlo tree search timed on every position
+MCTS_PLAYOUTS = 1000
+# kinds of result, with the work each counts and its rate per second;
+# playouts are not search nodes, so they are only ever compared with playouts
+KINDS = [('perft', 'nodes', 'nps'), ('search', 'nodes', 'nps'), ('endgame', 'nodes', 'nps'),
+         ('mcts', 'playouts', 'pps')]
+
+def perft(position, depth):
+    """
+    Return the number of leaves of the game tree below an OthelloPosition, depth moves deep.
+    A pass counts as a move, a finished game is a leaf.
+    """
+    if depth == 0:
+        return 1
+    moves = position.moves()
+    if not moves:
+        if not position.has_moves(-position.side):
+            return 1
+        return perft(position.pass_turn(), depth-1)
+    nodes = 0
+    for pos, flips in moves:
+        nodes += perft(position.play(pos, flips), depth-1)
+    return nodes
+
+def bench_perft(engine, depth):
+    """
+    Return the result of a perft count to depth from the start position.
+    """
+    game = Othello.GameBoard(engine=engine)
+    start = time.time()
+    nodes = perft(game.position, depth)
+    seconds = time.time() - start
+    expected = PERFT_COUNTS[depth] if depth < len(PERFT_COUNTS) else None
+    return {'name': 'perft%i' % depth, 'depth': depth, 'nodes': nodes,
+            'expected': expected, 'ok': expected is None or nodes == expected,
+            'seconds': seconds, 'nps': nodes / max(seconds, 1e-9)}
+
+def bench_search(engine, name, position, side, strat, depth):
+    """
+    Return the result of one search on a position with a fresh OthelloAI.
+    """
+    game = Othello.GameBoard(engine=engine)
+    game.load_position(position, side)
+    searcher = ai.OthelloAI(game, side, strat)
+    start = time.time()
+    if strat == ai.SHALLOW:
+        move = searcher.shallow_search()
+    elif strat == ai.MINIMAX:
+        move = searcher.minimax_search(depth)
+    elif strat == ai.ALPHABETA:
+        move = searcher.alphabeta_search(depth)
+    else:
+        move = searcher.pvs_search(depth)
+    seconds = time.time() - start
+    return {'name': name, 'depth': depth, 'move': move, 'nodes': searcher.nodes,
+            'seconds': seconds, 'nps': searcher.nodes / max(seconds, 1e-9)}
+
+def _new_bytes(parent, child):
+    """
+    Return the size of a position made by parent.play and of the values
+    it holds that are not parent's and not small integers (which CPython caches).
+    """
+    size = sys.getsizeof(child)
+    for name in OthelloPosition.Position.__slots__ + type(child).__slots__:
+        value = getattr(child, name)
+        if value is getattr(parent, name) or value is None:
+            continue
+        if isinstance(value, int) and -5 <= value <= 256:
+            continue
+        size += sys.getsizeof(value)
+    return size
+
+def count_positions(function, *args):
+    """
+    Return a dictionary of the positions made by play while function(*args)
+    runs and their position_bytes (see _new_bytes), what a search allocates
+    per node beyond its move lists. play is counted by wrapping it, so the
+    run is slower and not timed.
+    """
+    counts = {'positions': 0, 'position_bytes': 0}
+    classes = [OthelloPosition.ListPosition, OthelloPosition.BitboardPosition]
+    originals = [cls.__dict__['play'] for cls in classes]
+
+    def counted(play):
+        def wrapper(self, *play_args):
+            child = play(self, *play_args)
+            if child is not None:
+                counts['positions'] += 1
+                counts['position_bytes'] += _new_bytes(self, child)
+            return child
+        return wrapper
+
+    for cls, play in zip(classes, originals):
+        cls.play = counted(play)
+    try:
+        function(*args)
+    finally:
+        for cls, play in zip(classes, originals):
+            cls.play = play
+    return counts
+
+def bench_mcts(engine, name, position, side, playouts):
+    """
+    Return the result of a Monte Carlo tree search of playouts playouts on a position.
+    """
+    game = Othello.GameBoard(engine=engine)
+    game.load_position(position, side)
+    searcher = ai.OthelloAI(game, side, ai.MCTS)
+    # the same playouts every run
+    random.seed(0)
+    start = time.time()
+    move = searcher.mcts_search(playouts=playouts)
+    seconds = time.time() - start
+    return {'name': name, 'move': move, 'playouts': searcher.last_playouts,
+            'seconds': seconds, 'pps': searcher.last_playouts / max(seconds, 1e-9)}
+
+def bench_endgame(engine, name, position, side):
+    """
+    Return the result of solving an endgame position exactly.
+    """
+    game = Othello.GameBoard(engine=engine)
+    game.load_position(position, side)
+    searcher = ai.OthelloAI(game, side, ai.ALPHABETA)
+    own, opp = game.bits(side)
+    start = time.time()
+    bit, score = searcher.solver.best_move(own, opp)
+    seconds = time.time() - start
+    nodes = searcher.solver.nodes
+    return {'name': name, 'depth': game.empty_count, 'move': bb.BIT_TO_SQUARE[bit],
+            'score': score, 'nodes': nodes, 'seconds': seconds, 'nps': nodes / max(seconds, 1e-9)}
+
+def run(engines=("list", "bitboard"), perft_depth=6, repeat=1, progress=True):
+    """
+    Run the whole suite and return its results as a dictionary.
+    Each benchmark runs repeat times and keeps its fastest run.
+    """
+    def fastest(function, *args):
+        best = None
+        for i in range(repeat):
+            result = function(*args)
+            if best is None or result['seconds'] < best['seconds']:
+                best = result
+        if progress:
+            count, rate = ('playouts', 'pps') if 'playouts' in best else ('nodes', 'nps')
+            sys.stderr.write('%-10s %-22s %10i %-8s %8.3fs %10.0f %s/s\n' % (
+                args[0], best['name'], best[count], count, best['seconds'], best[rate], count))
+        return best
+
+    report = {'python': platform.python_version(), 'time': time.time(), 'repeat': repeat,
+              'engines': {}}
+    for engine in engines:
+        results = dict((kind, []) for kind, count, rate in KINDS)
+        for depth in range(1, perft_depth+1):
+            results['perft'].append(fastest(bench_perft, engine, depth))
+        for position_name, position, side in MIDGAME_POSITIONS + ENDGAME_POSITIONS:
+            for search_name, strat, depth in SEARCHES:
+                name = '%s-%s%i' % (position_name, search_name, depth)
+                result = fastest(
+                    lambda engine, name: bench_search(engine, name, position, side, strat, depth),
+                    engine, name)
+                result.update(count_positions(bench_search, engine, name, position, side, strat, depth))
+                if progress:
+                    sys.stderr.write('%-10s %-22s %10i positions %8.0f bytes/node\n' % (
+                        engine, name, result['positions'],
+                        result['position_bytes'] / float(max(result['nodes'], 1))))
+                results['search'].append(result)
+            results['mcts'].append(fastest(
+                lambda engine, name: bench_mcts(engine, name, position, side, MCTS_PLAYOUTS),
+                engine, '%s-mcts%i' % (position_name, MCTS_PLAYOUTS)))
+        for position_name, position, side in ENDGAME_POSITIONS:
+            results['endgame'].append(fastest(
+                lambda engine, name: bench_endgame(engine, name, position, side),
+                engine, position_name + '-solve'))
+        report['engines'][engine] = results
+    return report
+
+def compare(old, new, tolerance=0.1):
+    """
+    Print the rate (nodes/sec, or playouts/sec for MCTS) of new against old
+    for every benchmark both reports have.
+    Return the number of regressions: benchmarks more than tolerance slower,
+    or with a different node or playout count or move (the search itself changed).
+    """
+    regressions = 0
+    print "%-10s %-24s %12s %12s %8s" % ('engine', 'benchmark', 'old rate', 'new rate', 'ratio')
+    for engine in sorted(new['engines']):
+        if engine not in old['engines']:
+            continue
+        for kind, count, rate in KINDS:
+            # reports from before a kind existed, or with it counted differently, are skipped
+            old_results = dict((result['name'], result) for result in old['engines'][engine].get(kind, [])
+                               if rate in result)
+            for result in new['engines'][engine].get(kind, []):
+                before = old_results.get(result['name'])
+                if before is None:
+                    continue
+                ratio = result[rate] / max(before[rate], 1e-9)
+                note = ''
+                if result[count] != before[count] or result.get('move') != before.get('move'):
+                    note = 'CHANGED'
+                    regressions += 1
+                elif ratio < 1 - tolerance:
+                    note = 'SLOWER'
+                    regressions += 1
+                print "%-10s %-24s %12.0f %12.0f %8.2f %-10s %s" % (engine, result['name'], before[rate],
+                                                                   result[rate], ratio, count + '/s', note)
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the Othello engines and AI searches.")
+    parser.add_argument("--engine", choices=["list", "bitboard"], action="append",
+                        help="engine to benchmark (default: both)")
+    parser.add_argument("--perft", type=int, default=6, help="deepest perft count")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each benchmark, the fastest is kept")
+    parser.add_argument("--output", help="file to write the JSON results to (default: stdout)")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="slowdown in nodes/s counted as a regression")
+    args = parser.parse_args(argv)
+    report = run(args.engine or ("list", "bitboard"), args.perft, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=1, sort_keys=True)
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=1, sort_keys=True)
+        print
+    failed = [result['name'] for results in report['engines'].values()
+              for result in results['perft'] if not result['ok']]
+    if failed:
+        print "Wrong perft counts: %s" % ' '.join(failed)
+        return 1
+    if args.compare:
+        with open(args.compare) as previous:
+            if compare(json.load(previous), report, args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Bitboard helpers for the Othello board game
+Each side is one 64-bit integer, bit (row*8 + col) set if it has a disc there
+Peter Elmers
+"""
+
+FULL = 0xFFFFFFFFFFFFFFFF
+# masks that clear the column a shift would wrap a disc into
+NOT_A_FILE = 0xFEFEFEFEFEFEFEFE
+NOT_H_FILE = 0x7F7F7F7F7F7F7F7F
+
+# (shift, mask) pairs for the 8 directions, positive shifts go left
+DIRECTIONS = [(1, NOT_A_FILE), (-1, NOT_H_FILE), (8, FULL), (-8, FULL),
+              (9, NOT_A_FILE), (-9, NOT_H_FILE), (7, NOT_H_FILE), (-7, NOT_A_FILE)]
+# opponent discs on the A and H files can only be flipped along a file,
+# so runs in the other directions are kept off them and cannot wrap
+INNER_FILES = NOT_A_FILE & NOT_H_FILE
+# (shift, mask of the opponent discs a run can cross) for each pair of opposite directions
+DIRECTION_PAIRS = [(1, INNER_FILES), (8, FULL), (9, INNER_FILES), (7, INNER_FILES)]
+
+# conversions between the 10x10 bordered board of GameBoard and bit indices
+SQUARE_TO_BIT = [None for i in range(100)]
+BIT_TO_SQUARE = [None for i in range(64)]
+for row in range(8):
+    for col in range(8):
+        SQUARE_TO_BIT[(row+1)*10 + col+1] = row*8 + col
+        BIT_TO_SQUARE[row*8 + col] = (row+1)*10 + col+1
+
+def _ray(bit, amount, mask):
+    ray = 0
+    next_sq = shift(1 << bit, amount, mask)
+    while next_sq:
+        ray |= next_sq
+        next_sq = shift(next_sq, amount, mask)
+    return ray
+
+def shift(bits, amount, mask):
+    """
+    Shift a bitboard by amount squares, dropping discs that leave the board.
+    """
+    if amount > 0:
+        return (bits << amount) & mask & FULL
+    return (bits >> -amount) & mask
+
+def count(bits):
+    """
+    Return the number of discs in a bitboard.
+    """
+    return bin(bits).count('1')
+
+def move_mask(own, opp):
+    """
+    Return a bitboard of all squares where own can legally play.
+    """
+    legal = 0
+    for amount, mask in DIRECTION_PAIRS:
+        # a run of opponent discs can be at most 6 long
+        opp_mask = opp & mask
+        run = (own << amount) & opp_mask
+        run |= (run << amount) & opp_mask
+        run |= (run << amount) & opp_mask
+        run |= (run << amount) & opp_mask
+        run |= (run << amount) & opp_mask
+        run |= (run << amount) & opp_mask
+        legal |= run << amount
+        run = (own >> amount) & opp_mask
+        run |= (run >> amount) & opp_mask
+        run |= (run >> amount) & opp_mask
+        run |= (run >> amount) & opp_mask
+        run |= (run >> amount) & opp_mask
+        run |= (run >> amount) & opp_mask
+        legal |= run >> amount
+    return legal & ~(own | opp) & FULL
+
+def flips(own, opp, bit):
+    """
+    Return a bitboard of the discs flipped by own playing on bit index bit.
+    Return 0 if nothing would be flipped.
+    """
+    flipped = 0
+    for first, ray in FORWARD_RAYS[bit]:
+        # nothing flips along a ray that does not start with an opponent disc
+        if opp & first:
+            # first square along the ray that is not an opponent disc
+            blockers = ray & ~opp
+            if blockers:
+                stop = blockers & -blockers
+                if stop & own:
+                    flipped |= ray & (stop - 1)
+    for first, ray in BACKWARD_RAYS[bit]:
+        if opp & first:
+            blockers = ray & ~opp
+            if blockers:
+                stop = 1 << (blockers.bit_length() - 1)
+                if stop & own:
+                    flipped |= ray & ~((stop << 1) - 1)
+    return flipped
+
+# (first square, squares) of the rays reachable from each bit in every
+# direction, split by whether the ray runs towards higher bits (forward) or
+# lower bits (backward). Rays too short to flip anything are left out.
+FORWARD_RAYS = [[(ray & -ray, ray) for ray in (_ray(bit, amount, mask) for amount, mask in DIRECTIONS if amount > 0)
+                 if count(ray) >= 2] for bit in range(64)]
+BACKWARD_RAYS = [[(1 << (ray.bit_length() - 1), ray) for ray in (_ray(bit, amount, mask) for amount, mask in DIRECTIONS if amount < 0)
+                  if count(ray) >= 2] for bit in range(64)]
+
+def squares(bits):
+    """
+    Return the GameBoard squares of every disc in a bitboard, in ascending order.
+    """
+    result = []
+    while bits:
+        low = bits & -bits
+        result.append(BIT_TO_SQUARE[low.bit_length()-1])
+        bits ^= low
+    return result
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Opening book for the Othello AI
+A book file is a header followed by fixed size records sorted by position hash,
+so it is opened with mmap and searched in place without parsing
+Peter Elmers
+"""
+
+import OthelloAI as ai
+import argparse, mmap, struct, sys
+
+MAGIC = 'OTHBOOK1'
+# magic, number of records, plies the book covers, search depth used
+HEADER = struct.Struct('<8sIII')
+# position hash (with side to move), best move square, score
+RECORD = struct.Struct('<QBh')
+# scores are stored as 16 bit integers, wins and losses are clamped
+MAX_SCORE = 32000
+
+# books opened by this process, by path
+_open_books = {}
+
+class OpeningBook(object):
+    """
+    Read-only view of a book file, looked up by GameBoard.position_key.
+    The file is memory-mapped, so processes opening the same book share its pages.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.plies, self.depth = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or len(self.data) != HEADER.size + self.count*RECORD.size:
+            self.close()
+            raise ValueError("%s is not an opening book" % path)
+
+    def lookup(self, key):
+        """
+        Return (move, score) stored for the position key, or None if it is not in the book.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record_key, move, score = RECORD.unpack_from(self.data, HEADER.size + middle*RECORD.size)
+            if record_key == key:
+                return move, score
+            if record_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+def open_book(path):
+    """
+    Return the OpeningBook for path, opening it once per process.
+    """
+    if path not in _open_books:
+        _open_books[path] = OpeningBook(path)
+    return _open_books[path]
+
+def write_book(path, entries, plies, depth):
+    """
+    Write a book file from a dictionary of position key -> (move, score).
+    """
+    with open(path, 'wb') as book_file:
+        book_file.write(HEADER.pack(MAGIC, len(entries), plies, depth))
+        for key in sorted(entries):
+            move, score = entries[key]
+            score = int(max(-MAX_SCORE, min(MAX_SCORE, score)))
+            book_file.write(RECORD.pack(key, move, score))
+
+def generate(path, plies=6, depth=5, progress=True):
+    """
+    Build a book covering the first plies moves of the game, every position
+    scored by alphabeta_search(depth), and write it to path.
+    Return the number of positions stored.
+    """
+    # imported here, Othello imports this module through OthelloAI
+    import Othello
+    game = Othello.GameBoard()
+    # transposition table scores are for the side at the root, so a
+    # searcher (and its table) for each side keeps them apart
+    searchers = {side: ai.OthelloAI(game, side, ai.ALPHABETA) for side in (game.BLACK, game.WHITE)}
+    entries = {}
+
+    def walk(ply):
+        side = game.side
+        key = game.position_key(side)
+        if key in entries:
+            return
+        moves = game.legal_moves(side)
+        if not moves:
+            return
+        searcher = searchers[side]
+        results = searcher.search_root(depth, searcher.ab_root_child)
+        best_move = searcher.best_root_move(results)
+        entries[key] = (best_move, max(score for score, pos in results))
+        if progress and len(entries) % 100 == 0:
+            sys.stdout.write('\r%i positions' % len(entries))
+            sys.stdout.flush()
+        if ply == plies:
+            return
+        for pos, flips in moves:
+            undo = game.make_move(pos, side, flips)
+            walk(ply+1)
+            game.unmake_move(undo)
+
+    walk(1)
+    write_book(path, entries, plies, depth)
+    if progress:
+        sys.stdout.write('\r%i positions\n' % len(entries))
+    return len(entries)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Generate an Othello opening book.")
+    parser.add_argument("path", help="book file to write")
+    parser.add_argument("--plies", type=int, default=6, help="moves of the game to cover")
+    parser.add_argument("--depth", type=int, default=5, help="alphabeta_search depth for each position")
+    args = parser.parse_args(argv)
+    generate(args.path, args.plies, args.depth)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Exact endgame solver for the Othello AI
+Searches to the end of the game on bitboards and returns the final disc difference
+Peter Elmers
+"""
+
+import OthelloBitboard as bb
+import time
+
+# above this many empties moves are sorted by the opponent's replies (fastest first),
+# at or below it by parity of their quadrant
+FASTEST_FIRST_EMPTIES = 5
+# positions with at least this many empties are remembered between searches
+CACHE_EMPTIES = 6
+CACHE_SIZE = 2**18
+
+# the four 4x4 quadrants of the board
+QUADRANTS = [0x0F0F0F0F, 0xF0F0F0F0, 0x0F0F0F0F << 32, 0xF0F0F0F0 << 32]
+QUADRANT_OF_BIT = [[i for i, quadrant in enumerate(QUADRANTS) if quadrant >> bit & 1][0]
+                   for bit in range(64)]
+
+class EndgameTimeout(Exception):
+    """
+    Raised when the solver passes its deadline or is stopped.
+    """
+    pass
+
+class EndgameSolver(object):
+    """
+    Negamax alphabeta search to the end of the game.
+    Scores are the mover's discs minus the opponent's at the end, like find_victor.
+    """
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        # (own, opp) -> (lower bound, upper bound) of the exact score, best move
+        self.cache = {}
+        self.nodes = 0
+        self.deadline = None
+        # a threading.Event that stops the search once set, checked with the deadline
+        self.stop = None
+
+    def best_move(self, own, opp, deadline=None):
+        """
+        Return (bit, score) of the best move for own, which must have a legal move.
+        Raise EndgameTimeout if time.time() passes deadline first.
+        """
+        self.deadline = deadline
+        empties = 64 - bb.count(own | opp)
+        alpha, beta = -64, 64
+        best = None
+        try:
+            for bit, new_own, new_opp in self.ordered_children(own, opp, empties):
+                if best is None:
+                    score = -self.solve(new_opp, new_own, -beta, -alpha, empties-1)
+                else:
+                    score = -self.solve(new_opp, new_own, -alpha-1, -alpha, empties-1)
+                    if score > alpha:
+                        score = -self.solve(new_opp, new_own, -beta, -score, empties-1)
+                if best is None or score > alpha:
+                    best = bit
+                    alpha = max(alpha, score)
+        finally:
+            self.deadline = None
+        return best, alpha
+
+    def ordered_children(self, own, opp, empties):
+        """
+        Return (bit, own after, opp after) for each move of own, best guesses first.
+        """
+        if empties > FASTEST_FIRST_EMPTIES:
+            return self.fastest_first(own, opp)
+        return self.parity_order(own, opp)
+
+    def fastest_first(self, own, opp):
+        """
+        Return the children of the position, fewest opponent replies first.
+        """
+        children = []
+        moves = bb.move_mask(own, opp)
+        while moves:
+            low = moves & -moves
+            moves ^= low
+            flipped = bb.flips(own, opp, low.bit_length() - 1)
+            new_own = own | flipped | low
+            new_opp = opp & ~flipped
+            children.append((bb.count(bb.move_mask(new_opp, new_own)), low, new_own, new_opp))
+        children.sort()
+        return [(low.bit_length() - 1, new_own, new_opp) for replies, low, new_own, new_opp in children]
+
+    def parity_order(self, own, opp):
+        """
+        Return the children of the position, moves into quadrants with an odd
+        number of empties first. With few empties trying every empty square
+        is cheaper than generating the move mask.
+        """
+        odd = []
+        even = []
+        empty = ~(own | opp) & bb.FULL
+        remaining = empty
+        while remaining:
+            low = remaining & -remaining
+            remaining ^= low
+            bit = low.bit_length() - 1
+            flipped = bb.flips(own, opp, bit)
+            if not flipped:
+                continue
+            if bb.count(empty & QUADRANTS[QUADRANT_OF_BIT[bit]]) & 1:
+                odd.append((bit, own | flipped | low, opp & ~flipped))
+            else:
+                even.append((bit, own | flipped | low, opp & ~flipped))
+        return odd + even
+
+    def solve(self, own, opp, alpha, beta, empties):
+        """
+        Return the final score of the position for own, with own to move.
+        The score is exact if it lies within (alpha, beta), else a bound.
+        """
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & 63:
+            if time.time() >= self.deadline or (self.stop is not None and self.stop.is_set()):
+                raise EndgameTimeout()
+        if empties == 1:
+            return self.last_move(own, opp)
+        cached = None
+        best_bit = None
+        if empties >= CACHE_EMPTIES:
+            cached = self.cache.get((own, opp))
+            if cached is not None:
+                lower, upper, best_bit = cached
+                if lower >= beta:
+                    return lower
+                if upper <= alpha:
+                    return upper
+                alpha = max(alpha, lower)
+                beta = min(beta, upper)
+                if alpha >= beta:
+                    return alpha
+        alpha_orig, beta_orig = alpha, beta
+        children = self.ordered_children(own, opp, empties)
+        if best_bit is not None:
+            # the move that was best last time goes first
+            for index, child in enumerate(children):
+                if child[0] == best_bit:
+                    if index:
+                        children.insert(0, children.pop(index))
+                    break
+        if not children:
+            if not bb.move_mask(opp, own):
+                # neither side can move, the game is over
+                return bb.count(own) - bb.count(opp)
+            return -self.solve(opp, own, -beta, -alpha, empties)
+        best = -65
+        for bit, new_own, new_opp in children:
+            if best == -65:
+                score = -self.solve(new_opp, new_own, -beta, -alpha, empties-1)
+            else:
+                # prove the move is no better than the best so far with a null window
+                score = -self.solve(new_opp, new_own, -alpha-1, -alpha, empties-1)
+                if alpha < score < beta:
+                    score = -self.solve(new_opp, new_own, -beta, -score, empties-1)
+            if score > best:
+                best = score
+                best_bit = bit
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if empties >= CACHE_EMPTIES:
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            lower, upper = cached[:2] if cached else (-64, 64)
+            if best <= alpha_orig:
+                upper = min(upper, best)
+            elif best >= beta_orig:
+                lower = max(lower, best)
+            else:
+                lower = upper = best
+            self.cache[(own, opp)] = (lower, upper, best_bit)
+        return best
+
+    def last_move(self, own, opp):
+        """
+        Return the final score for own with a single empty square left.
+        """
+        empty = ~(own | opp) & bb.FULL
+        bit = empty.bit_length() - 1
+        score = bb.count(own) - bb.count(opp)
+        flipped = bb.count(bb.flips(own, opp, bit))
+        if flipped:
+            return score + 2*flipped + 1
+        # own passes, the opponent may still take the square
+        flipped = bb.count(bb.flips(opp, own, bit))
+        if flipped:
+            return score - 2*flipped - 1
+        return score
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Monte Carlo tree search for the Othello AI
+Grows a tree of bitboard positions with UCT, scoring each new node by one
+playout of random (or WEIGHTS-weighted) moves to the end of the game. The
+tree is kept between moves and re-rooted at the position reached, so the
+playouts already spent below it still count
+Peter Elmers
+"""
+
+import OthelloBitboard as bb
+import math, random, time
+
+# exploration constant of UCT
+EXPLORATION = 1.4
+# untried moves of a position where the side to move has to pass
+PASS_MASK = 1 << 64
+# plies below the old root searched for the new position, a move, a reply and a pass
+REUSE_PLIES = 3
+
+class Node(object):
+    """
+    A position in the tree: own and opp are the bitboards of the side to move and
+    the other side, move the bit index played to reach it (None for a pass).
+    wins counts the playouts below it won by the side that played move, draws as half.
+    untried is the bitboard of moves without a child yet, PASS_MASK for a pass.
+    """
+    __slots__ = ('own', 'opp', 'move', 'parent', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, own, opp, move=None, parent=None):
+        self.own = own
+        self.opp = opp
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = bb.move_mask(own, opp)
+        if not self.untried and bb.move_mask(opp, own):
+            self.untried = PASS_MASK
+        self.visits = 0
+        self.wins = 0.0
+
+def _random_bit(mask):
+    """
+    Return a uniformly chosen set bit index of a non-zero bitboard.
+    """
+    chosen = random.randrange(bb.count(mask))
+    while chosen:
+        mask &= mask - 1
+        chosen -= 1
+    return (mask & -mask).bit_length() - 1
+
+class MonteCarloSearch(object):
+    """
+    Finds moves with Monte Carlo tree search, keeping the tree from one search to the next.
+    weights is a 100 square table like OthelloAI.WEIGHTS for weighted playouts,
+    which pick squares with probability rising with their weight, or None
+    for uniformly random playouts.
+    After each search, playouts and seconds hold what it took.
+    """
+    def __init__(self, weights=None, exploration=EXPLORATION):
+        self.exploration = exploration
+        self.bit_weights = None
+        if weights is not None:
+            lowest = min(weights[pos] for pos in bb.BIT_TO_SQUARE)
+            # the worst square still gets played now and then
+            self.bit_weights = [weights[pos] - lowest + 1 for pos in bb.BIT_TO_SQUARE]
+        self.root = None
+        self.playouts = 0
+        self.seconds = 0.0
+
+    def find_root(self, own, opp):
+        """
+        Return the node of the position own, opp to move: the old root or a node
+        at most REUSE_PLIES below it, cut loose from the rest of the old tree,
+        or a new node if the tree does not have the position.
+        """
+        level = [self.root] if self.root is not None else []
+        for ply in range(REUSE_PLIES + 1):
+            for node in level:
+                if node.own == own and node.opp == opp:
+                    node.parent = None
+                    return node
+            level = [child for node in level for child in node.children]
+        return Node(own, opp)
+
+    def search(self, own, opp, playouts=None, deadline=None):
+        """
+        Return the bit index of the move for own, the side to move, that was
+        visited most, searching until playouts playouts or until a playout as
+        slow as the slowest so far would not end before deadline, whichever
+        comes first. At least one playout is made. own must have a legal move.
+        """
+        start = time.time()
+        root = self.root = self.find_root(own, opp)
+        done = 0
+        slowest = 0.0
+        before = start
+        while playouts is None or done < playouts:
+            if deadline is not None and done:
+                now = time.time()
+                slowest = max(slowest, now - before)
+                before = now
+                if now + slowest >= deadline:
+                    break
+            self.step(root)
+            done += 1
+        self.playouts = done
+        self.seconds = time.time() - start
+        best = None
+        for child in root.children:
+            if best is None or child.visits > best.visits:
+                best = child
+        if best is None:
+            # no playout at all, the first legal move
+            return (root.untried & -root.untried).bit_length() - 1
+        return best.move
+
+    def step(self, root):
+        """
+        Select a leaf with UCT, expand it by one move, play a game out from
+        there and count the result on the path back to the root.
+        """
+        node = root
+        # descend through fully expanded nodes
+        while not node.untried and node.children:
+            log_visits = math.log(node.visits)
+            best_value = None
+            for child in node.children:
+                value = child.wins / child.visits + self.exploration * math.sqrt(log_visits / child.visits)
+                if best_value is None or value > best_value:
+                    best_value = value
+                    best = child
+            node = best
+        if node.untried:
+            node = self.expand(node)
+        result = self.playout(node.own, node.opp)
+        # result is for the side to move at node, wins count for the side that moved there
+        while node is not None:
+            node.visits += 1
+            node.wins += 1.0 - result
+            result = 1.0 - result
+            node = node.parent
+
+    def expand(self, node):
+        """
+        Add the child of one untried move of node and return it.
+        """
+        if node.untried == PASS_MASK:
+            node.untried = 0
+            child = Node(node.opp, node.own, None, node)
+        else:
+            low = node.untried & -node.untried
+            node.untried ^= low
+            bit = low.bit_length() - 1
+            flipped = bb.flips(node.own, node.opp, bit)
+            child = Node(node.opp ^ flipped, node.own | flipped | low, bit, node)
+        node.children.append(child)
+        return child
+
+    def playout(self, own, opp):
+        """
+        Return 1, 0.5 or 0 for a win, draw or loss of own, the side to move,
+        after playing random moves to the end of the game.
+        """
+        bit_weights = self.bit_weights
+        # 1 while own is the side the result is for
+        sign = 1
+        passed = False
+        while True:
+            mask = bb.move_mask(own, opp)
+            if mask:
+                passed = False
+                if bit_weights is None:
+                    bit = _random_bit(mask)
+                else:
+                    bit = self.weighted_bit(mask)
+                flipped = bb.flips(own, opp, bit)
+                own, opp = opp ^ flipped, own | flipped | (1 << bit)
+            elif passed:
+                break
+            else:
+                passed = True
+                own, opp = opp, own
+            sign = -sign
+        difference = sign * (bb.count(own) - bb.count(opp))
+        if difference > 0:
+            return 1.0
+        if difference < 0:
+            return 0.0
+        return 0.5
+
+    def weighted_bit(self, mask):
+        """
+        Return a set bit index of a non-zero bitboard, chosen with probability
+        proportional to its weight.
+        """
+        bit_weights = self.bit_weights
+        bits = []
+        total = 0
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            bit = low.bit_length() - 1
+            bits.append(bit)
+            total += bit_weights[bit]
+        chosen = random.random() * total
+        for bit in bits:
+            chosen -= bit_weights[bit]
+            if chosen < 0:
+                return bit
+        return bits[-1]
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Parallel root search for the Othello AI
+The first root move is searched in the calling process, the others in a
+process pool with the first move's score as alpha
+Peter Elmers
+"""
+
+import argparse, multiprocessing, sys
+
+# pools started by this process, by number of workers
+_pools = {}
+# a worker's searcher for each (tt_size, evaluation, pattern_file, side), kept so its transposition
+# table carries over from one task to the next; table scores are for the side at the root, so each
+# side has its own
+_searchers = {}
+
+def get_pool(workers):
+    """
+    Return a process pool with workers processes, starting it once per process.
+    """
+    if workers not in _pools:
+        _pools[workers] = multiprocessing.Pool(workers)
+    return _pools[workers]
+
+def can_fork():
+    """
+    Return False inside daemonic processes (pool workers), which cannot start a pool.
+    """
+    return not multiprocessing.current_process().daemon
+
+def _search_child(task):
+    """
+    Return (score, nodes) of a root move's reply searched with the window (alpha, inf).
+    Runs in a pool worker.
+    """
+    # imported here, Othello imports this module through OthelloAI
+    import Othello
+    import OthelloAI as ai
+    position, ply, alpha, options = task
+    # the root side, the position is after its move
+    side = -position.side
+    if options + (side,) not in _searchers:
+        tt_size, evaluation, pattern_file = options
+        game = Othello.GameBoard(engine=position.engine)
+        _searchers[options + (side,)] = ai.OthelloAI(game, side, ai.ALPHABETA, tt_size=tt_size,
+                                                     evaluation=evaluation, pattern_file=pattern_file)
+    searcher = _searchers[options + (side,)]
+    nodes = searcher.nodes
+    # the position comes with its pattern indices, the searcher's game is not used
+    score = searcher.ab_minimize(position, ply, alpha, float("inf"))
+    return score, searcher.nodes - nodes
+
+def search_root(searcher, maxply, workers, position=None):
+    """
+    Return a list of (score, move) for the root moves of position (the searcher's
+    game position if None) like OthelloAI.search_root with ab_root_child,
+    searching all moves after the first in workers processes.
+    Scores of moves no better than the first are only upper bounds, so
+    best_root_move picks the same move as the serial search.
+    """
+    position = searcher.search_position(position)
+    moves = position.moves()
+    if not moves:
+        return []
+    first, flips = moves[0]
+    alpha = searcher.ab_root_child(position.play(first, flips), maxply)
+    options = (searcher.tt.size, searcher.evaluation, searcher.pattern_file)
+    # positions are sent to the workers as they are
+    tasks = [(position.play(pos, flips), maxply, alpha, options) for pos, flips in moves[1:]]
+    results = [(alpha, first)]
+    if tasks:
+        for (score, nodes), (pos, flips) in zip(get_pool(workers).map(_search_child, tasks, 1), moves[1:]):
+            searcher.nodes += nodes
+            results.append((score, pos))
+    return results
+
+def compare_games(seeds, workers, engine="list", ai_options=None):
+    """
+    Play an alphabeta self-play game from a random start for every seed, once
+    with serial and once with workers process root searches, and return a
+    list of (seed, ply) of the first move the two games differ in, ply None
+    for games played the same.
+    """
+    import Othello
+    import OthelloAI as ai
+    differences = []
+    for seed in seeds:
+        histories = []
+        for game_workers in (1, workers):
+            options = dict(ai_options or {}, workers=game_workers)
+            game = Othello._run_game(ai.ALPHABETA, ai.ALPHABETA, "random", engine, seed, options)
+            histories.append(game.history)
+        serial, parallel = histories
+        ply = None
+        if serial != parallel:
+            ply = min(index for index in range(max(len(serial), len(parallel)))
+                      if serial[index:index+1] != parallel[index:index+1])
+        differences.append((seed, ply))
+    return differences
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Check that parallel alphabeta root searches "
+                                                 "play the same games as serial ones.")
+    parser.add_argument("--games", type=int, default=8, help="number of games to play")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--workers", type=int, default=3, help="processes for each parallel search")
+    parser.add_argument("--engine", choices=["list", "bitboard"], default="list")
+    parser.add_argument("--endgame-empties", type=int, default=0,
+                        help="empty squares from which the endgame solver plays instead")
+    args = parser.parse_args(argv)
+    differing = 0
+    for seed, ply in compare_games(range(args.seed, args.seed + args.games), args.workers,
+                                   args.engine, {'endgame_empties': args.endgame_empties}):
+        if ply is None:
+            print "seed %i: same" % seed
+        else:
+            print "seed %i: differs from ply %i" % (seed, ply)
+            differing += 1
+    if differing:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,219 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Pattern evaluation for the Othello AI
+Edges, second rows, diagonals and corner regions are read as base 3 numbers
+(0 empty, 1 white, 2 black) that positions keep up to date on every move,
+and each is scored by looking it up in a table. Tables can be saved to and
+loaded from a file
+Peter Elmers
+"""
+
+import OthelloBitboard as bb
+import argparse, struct, sys
+
+MAGIC = 'OTHPAT01'
+# table values are in units of 1/SCALE of a WEIGHTS point,
+# so squares shared by 1-4 patterns split their weight evenly
+SCALE = 12
+# value of having one more legal move than the opponent, in WEIGHTS points
+MOBILITY = 10
+# bonus of an edge disc that can never be flipped, in WEIGHTS points
+STABLE = 10
+
+# kinds of pattern and the squares of each instance, symmetric instances share a table
+PATTERNS = [
+    ('edge', [11,12,13,14,15,16,17,18]),
+    ('edge', [81,82,83,84,85,86,87,88]),
+    ('edge', [11,21,31,41,51,61,71,81]),
+    ('edge', [18,28,38,48,58,68,78,88]),
+    ('row2', [21,22,23,24,25,26,27,28]),
+    ('row2', [71,72,73,74,75,76,77,78]),
+    ('row2', [12,22,32,42,52,62,72,82]),
+    ('row2', [17,27,37,47,57,67,77,87]),
+    ('diagonal', [11,22,33,44,55,66,77,88]),
+    ('diagonal', [18,27,36,45,54,63,72,81]),
+    ('corner', [11,12,13,21,22,23,31,32,33]),
+    ('corner', [18,17,16,28,27,26,38,37,36]),
+    ('corner', [81,82,83,71,72,73,61,62,63]),
+    ('corner', [88,87,86,78,77,76,68,67,66]),
+]
+KINDS = ['edge', 'row2', 'diagonal', 'corner']
+TABLE_SIZES = dict((kind, 3**len(squares)) for kind, squares in PATTERNS)
+
+# (pattern number, power of 3) of every square, for the incremental updates
+SQUARE_TERMS = [[] for pos in range(100)]
+for number, (kind, squares) in enumerate(PATTERNS):
+    for place, pos in enumerate(squares):
+        SQUARE_TERMS[pos].append((number, 3**place))
+BIT_TERMS = [SQUARE_TERMS[pos] for pos in bb.BIT_TO_SQUARE]
+
+# number of patterns each square is in
+COVERAGE = [len(terms) for terms in SQUARE_TERMS]
+
+def digit(value):
+    """
+    Return the base 3 digit of a board value: 0 empty, 1 white, 2 black.
+    """
+    return {0: 0, 1: 1, -1: 2}.get(value, 0)
+
+def compute_indices(board):
+    """
+    Return the index of every pattern on a 100 integer board, computed from scratch.
+    """
+    indices = []
+    for kind, squares in PATTERNS:
+        index = 0
+        for place, pos in enumerate(squares):
+            index += digit(board[pos]) * 3**place
+        indices.append(index)
+    return indices
+
+def update(indices, move_pos, side, flipped):
+    """
+    Update indices in place for side playing move_pos and flipping the squares flipped.
+    """
+    placed = 1 if side == 1 else 2
+    # a flipped disc goes from 2 to 1 for white, 1 to 2 for black
+    change = -1 if side == 1 else 1
+    for number, power in SQUARE_TERMS[move_pos]:
+        indices[number] += placed * power
+    for pos in flipped:
+        for number, power in SQUARE_TERMS[pos]:
+            indices[number] += change * power
+
+def update_bits(indices, bit, side, flipped):
+    """
+    Like update, with the move as a bit index and the flipped discs as a bitboard.
+    """
+    placed = 1 if side == 1 else 2
+    change = -1 if side == 1 else 1
+    for number, power in BIT_TERMS[bit]:
+        indices[number] += placed * power
+    while flipped:
+        low = flipped & -flipped
+        flipped ^= low
+        for number, power in BIT_TERMS[low.bit_length() - 1]:
+            indices[number] += change * power
+
+def _digits(index, length):
+    digits = []
+    for place in range(length):
+        digits.append(index % 3)
+        index //= 3
+    return digits
+
+def _default_value(kind, squares, digits):
+    """
+    Return the score for white of one pattern instance, from ai.WEIGHTS
+    with the corner-dependent squares and stable edge discs valued by their context.
+    """
+    # imported here, OthelloAI imports this module
+    import OthelloAI as ai
+    sign = [0, 1, -1]
+    value = 0
+    for place, pos in enumerate(squares):
+        value += sign[digits[place]] * (SCALE * ai.WEIGHTS[pos] // COVERAGE[pos])
+    if kind == 'edge':
+        # a C-square next to a taken corner no longer gives the corner away
+        for corner, c_square in ((0, 1), (7, 6)):
+            if digits[corner] and digits[c_square]:
+                value += sign[digits[c_square]] * SCALE * 25
+        stable = set()
+        if all(digits):
+            stable = set(range(8))
+        for order in (range(8), range(7, -1, -1)):
+            if digits[order[0]]:
+                for place in order:
+                    if digits[place] != digits[order[0]]:
+                        break
+                    stable.add(place)
+        for place in stable:
+            value += sign[digits[place]] * SCALE * STABLE
+    elif kind == 'corner':
+        # so does the X-square
+        if digits[0] and digits[4]:
+            value += sign[digits[4]] * SCALE * 35
+    return value
+
+def default_tables():
+    """
+    Return a dictionary of kind -> table built from ai.WEIGHTS and the edge rules.
+    """
+    tables = {}
+    for kind, squares in PATTERNS:
+        if kind in tables:
+            continue
+        length = len(squares)
+        tables[kind] = [_default_value(kind, squares, _digits(index, length))
+                        for index in range(3**length)]
+    return tables
+
+def save_tables(path, tables):
+    """
+    Write tables to path: the magic string, then each kind's table as 32 bit integers.
+    """
+    with open(path, 'wb') as table_file:
+        table_file.write(MAGIC)
+        for kind in KINDS:
+            table = tables[kind]
+            table_file.write(struct.pack('<%ii' % len(table), *table))
+
+def load_tables(path):
+    """
+    Return the tables written to path by save_tables.
+    """
+    with open(path, 'rb') as table_file:
+        data = table_file.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("%s is not a pattern table file" % path)
+    tables = {}
+    offset = len(MAGIC)
+    for kind in KINDS:
+        size = TABLE_SIZES[kind]
+        tables[kind] = list(struct.unpack_from('<%ii' % size, data, offset))
+        offset += 4 * size
+    if offset != len(data):
+        raise ValueError("%s has the wrong size for a pattern table file" % path)
+    return tables
+
+# tables by path, None for the defaults, built or read once per process
+_tables = {}
+
+def get_tables(path=None):
+    """
+    Return the tables in path, or the default tables if path is None.
+    """
+    if path not in _tables:
+        _tables[path] = default_tables() if path is None else load_tables(path)
+    return _tables[path]
+
+class PatternEvaluator(object):
+    """
+    Scores an OthelloPosition that keeps pattern indices (see Position.with_patterns).
+    """
+    def __init__(self, path=None):
+        tables = get_tables(path)
+        # the table of every pattern instance, in the order of the indices
+        self.tables = [tables[kind] for kind, squares in PATTERNS]
+
+    def score(self, position):
+        """
+        Return the position's score for white in WEIGHTS points.
+        """
+        total = 0
+        for table, index in zip(self.tables, position.pattern_indices):
+            total += table[index]
+        # counted by the position's engine without listing the moves
+        total += SCALE * MOBILITY * (position.mobility(position.WHITE) - position.mobility(position.BLACK))
+        return total // SCALE
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Write the default pattern tables to a file.")
+    parser.add_argument("path", help="table file to write")
+    args = parser.parse_args(argv)
+    save_tables(args.path, default_tables())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
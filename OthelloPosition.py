@@ -0,0 +1,488 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Search positions for the Othello board game
+A position is the discs, the side to move and the passes in a row before
+it, with the Zobrist hash, disc counts, weight score and pattern indices
+kept up to date. Positions never change once made: play and pass_turn
+return new ones, so searches never touch the GameBoard and any number of
+them can share a position
+Peter Elmers
+"""
+
+import OthelloAI as ai
+import OthelloBitboard as bb
+import OthelloPattern
+import OthelloTT as tt
+
+BORDER = 2
+EMPTY = 0
+WHITE = 1
+BLACK = -1
+
+PIECE_KEYS = {WHITE: tt.WHITE_KEYS, BLACK: tt.BLACK_KEYS}
+# squares of the board, in order, without the border
+BOARD_RANGE = [pos for pos in range(11, 89) if 1 <= pos % 10 <= 8]
+# Zobrist keys of flipping the disc on each bit of a bitboard
+BIT_FLIP_KEYS = [tt.FLIP_KEYS[pos] for pos in bb.BIT_TO_SQUARE]
+BIT_WEIGHTS = [ai.WEIGHTS[pos] for pos in bb.BIT_TO_SQUARE]
+
+def _rays(move_pos):
+    rays = []
+    for direction in [1,-1,10,-10,9,-9,11,-11]:
+        ray = []
+        next_pos = move_pos + direction
+        while 11 <= next_pos <= 88 and 1 <= next_pos % 10 <= 8:
+            ray.append(next_pos)
+            next_pos += direction
+        # a ray needs an opponent disc and an own disc to flip anything
+        if len(ray) >= 2:
+            rays.append(ray)
+    return rays
+
+# squares in each direction from every square of the board, up to the border
+RAYS = [_rays(pos) for pos in range(100)]
+
+def start_board():
+    """
+    Return the 100 integer board of the start position, 8x8 enclosed in 10x10 with borders.
+    """
+    board = [EMPTY for i in range(100)]
+    for i in range(100):
+        if i % 10 == 0 or i % 10 == 9 or i < 10 or i > 89:
+            board[i] = BORDER
+    board[44] = board[55] = WHITE
+    board[45] = board[54] = BLACK
+    return board
+
+def board_hash(board):
+    """
+    Return the Zobrist hash of the discs on a 100 integer board, computed from scratch.
+    """
+    result = 0
+    for pos in BOARD_RANGE:
+        if board[pos] == WHITE or board[pos] == BLACK:
+            result ^= PIECE_KEYS[board[pos]][pos]
+    return result
+
+def board_counts(board):
+    """
+    Return the white, black and empty square counts and the weight score
+    (sum of ai.WEIGHTS of white discs minus black discs) of a 100 integer board.
+    """
+    white_count = black_count = empty_count = weight_score = 0
+    for pos in BOARD_RANGE:
+        if board[pos] == WHITE:
+            white_count += 1
+        elif board[pos] == BLACK:
+            black_count += 1
+        else:
+            empty_count += 1
+        weight_score += board[pos] * ai.WEIGHTS[pos]
+    return white_count, black_count, empty_count, weight_score
+
+class Position(object):
+    """
+    What ListPosition and BitboardPosition share: side to move, passes
+    (in a row, 2 ends the game), hash of the discs, disc counts, weight
+    score and OthelloPattern indices (None unless tracked).
+    """
+    __slots__ = ('side', 'passes', 'hash', 'white_count', 'black_count', 'empty_count',
+                 'weight_score', 'pattern_indices')
+    WHITE = WHITE
+    BLACK = BLACK
+    EMPTY = EMPTY
+
+    def key(self):
+        """
+        Return the hash of the position with the side to move.
+        """
+        if self.side == BLACK:
+            return self.hash ^ tt.BLACK_TO_MOVE
+        return self.hash
+
+    def is_over(self):
+        """
+        Return True if both sides have passed or the board is full.
+        """
+        return self.passes == 2 or self.empty_count == 0
+
+    def victor(self):
+        """
+        Return the winner (WHITE, BLACK or EMPTY for a draw) and the white and black counts.
+        """
+        return cmp(self.white_count, self.black_count), self.white_count, self.black_count
+
+    def moves(self):
+        """
+        Return legal_moves of the side to move.
+        """
+        return self.legal_moves(self.side)
+
+    def pass_turn(self):
+        """
+        Return the position after the side to move passes.
+        """
+        return self.with_turn(-self.side, self.passes + 1)
+
+    def as_bitboard(self):
+        """
+        Return the same position as a BitboardPosition.
+        """
+        white, black = self.bits(WHITE)
+        return BitboardPosition(white, black, self.side, self.passes, self.hash, self.white_count,
+                                self.black_count, self.empty_count, self.weight_score,
+                                self.pattern_indices)
+
+class ListPosition(Position):
+    """
+    Position storing the discs as a 100 integer board, never written to once made.
+    play copies the board, so the AI searches a BitboardPosition (as_bitboard)
+    instead, which makes no list per node (see the position counts of OthelloBench).
+    """
+    __slots__ = ('board',)
+    engine = "list"
+
+    def __init__(self, board, side, passes, hash, white_count, black_count, empty_count,
+                 weight_score, pattern_indices):
+        self.board = board
+        self.side = side
+        self.passes = passes
+        self.hash = hash
+        self.white_count = white_count
+        self.black_count = black_count
+        self.empty_count = empty_count
+        self.weight_score = weight_score
+        self.pattern_indices = pattern_indices
+
+    def with_turn(self, side, passes):
+        """
+        Return the same discs with side to move after passes passes.
+        """
+        return ListPosition(self.board, side, passes, self.hash, self.white_count, self.black_count,
+                            self.empty_count, self.weight_score, self.pattern_indices)
+
+    def with_patterns(self):
+        """
+        Return the same position keeping OthelloPattern indices.
+        """
+        if self.pattern_indices is not None:
+            return self
+        return ListPosition(self.board, self.side, self.passes, self.hash, self.white_count,
+                            self.black_count, self.empty_count, self.weight_score,
+                            OthelloPattern.compute_indices(self.board))
+
+    def bits(self, side):
+        """
+        Return the bitboards of side and its opponent.
+        """
+        board = self.board
+        own = opp = 0
+        for bit, pos in enumerate(bb.BIT_TO_SQUARE):
+            if board[pos] == side:
+                own |= 1 << bit
+            elif board[pos] == -side:
+                opp |= 1 << bit
+        return own, opp
+
+    def flipped_squares(self, move_pos, side):
+        """
+        Return a list of positions that would be flipped by a tile played at move_pos.
+        """
+        board = self.board
+        to_flip = []
+        for ray in RAYS[move_pos]:
+            if board[ray[0]] == -side:
+                for index in range(1, len(ray)):
+                    value = board[ray[index]]
+                    if value == side:
+                        to_flip += ray[:index]
+                        break
+                    if value != -side:
+                        break
+        return to_flip
+
+    def legal_move(self, move_pos, side):
+        """
+        Return False if move is not legal.
+        Return list of tiles to flip if legal.
+        """
+        if self.board[move_pos] != EMPTY:
+            return False
+        flipped = self.flipped_squares(move_pos, side)
+        if not flipped:
+            return False
+        return flipped
+
+    def legal_moves(self, side):
+        """
+        Return a list of (move, flips) for every legal move of side, in BOARD_RANGE order.
+        flips can be passed back to play to skip recomputing them.
+        """
+        board = self.board
+        moves = []
+        for pos in BOARD_RANGE:
+            if board[pos] == EMPTY:
+                flipped = self.flipped_squares(pos, side)
+                if flipped:
+                    moves.append((pos, flipped))
+        return moves
+
+    def _count_moves(self, side, limit):
+        # legal moves of side up to limit, found without listing what they flip
+        board = self.board
+        count = 0
+        for pos in BOARD_RANGE:
+            if board[pos] == EMPTY:
+                for ray in RAYS[pos]:
+                    if board[ray[0]] == -side:
+                        for next_pos in ray:
+                            value = board[next_pos]
+                            if value != -side:
+                                break
+                        if value == side:
+                            count += 1
+                            if count == limit:
+                                return count
+                            break
+        return count
+
+    def has_moves(self, side):
+        """
+        Return True if side has a legal move.
+        """
+        return self._count_moves(side, 1) > 0
+
+    def mobility(self, side):
+        """
+        Return the number of legal moves of side.
+        """
+        return self._count_moves(side, 64)
+
+    def play(self, move_pos, to_flip=None):
+        """
+        Return the position after the side to move plays move_pos, None if that is illegal.
+        to_flip is the flips legal_moves gave for this move, if known.
+        """
+        side = self.side
+        if to_flip is None:
+            to_flip = self.legal_move(move_pos, side)
+            if to_flip == False:
+                return None
+        pattern_indices = self.pattern_indices
+        if pattern_indices is not None:
+            pattern_indices = pattern_indices[:]
+            OthelloPattern.update(pattern_indices, move_pos, side, to_flip)
+        board = self.board[:]
+        new_hash = self.hash ^ PIECE_KEYS[side][move_pos]
+        weight_score = self.weight_score + side * ai.WEIGHTS[move_pos]
+        # a flip removes the weight from one side and gives it to the other
+        gain = side + side
+        for pos in to_flip:
+            board[pos] = side
+            new_hash ^= tt.FLIP_KEYS[pos]
+            weight_score += gain * ai.WEIGHTS[pos]
+        board[move_pos] = side
+        flip_count = len(to_flip)
+        if side == WHITE:
+            white_count = self.white_count + flip_count + 1
+            black_count = self.black_count - flip_count
+        else:
+            black_count = self.black_count + flip_count + 1
+            white_count = self.white_count - flip_count
+        return ListPosition(board, -side, 0, new_hash, white_count, black_count,
+                            self.empty_count - 1, weight_score, pattern_indices)
+
+class BitboardPosition(Position):
+    """
+    Position storing the discs as two 64-bit integers, one per side.
+    board is still available as a 100 integer list, built on demand.
+    """
+    __slots__ = ('white', 'black')
+    engine = "bitboard"
+
+    def __init__(self, white, black, side, passes, hash, white_count, black_count, empty_count,
+                 weight_score, pattern_indices):
+        self.white = white
+        self.black = black
+        self.side = side
+        self.passes = passes
+        self.hash = hash
+        self.white_count = white_count
+        self.black_count = black_count
+        self.empty_count = empty_count
+        self.weight_score = weight_score
+        self.pattern_indices = pattern_indices
+
+    @property
+    def board(self):
+        board = [BORDER for i in range(100)]
+        for bit, pos in enumerate(bb.BIT_TO_SQUARE):
+            if self.white >> bit & 1:
+                board[pos] = WHITE
+            elif self.black >> bit & 1:
+                board[pos] = BLACK
+            else:
+                board[pos] = EMPTY
+        return board
+
+    def with_turn(self, side, passes):
+        """
+        Return the same discs with side to move after passes passes.
+        """
+        return BitboardPosition(self.white, self.black, side, passes, self.hash, self.white_count,
+                                self.black_count, self.empty_count, self.weight_score,
+                                self.pattern_indices)
+
+    def with_patterns(self):
+        """
+        Return the same position keeping OthelloPattern indices.
+        """
+        if self.pattern_indices is not None:
+            return self
+        return BitboardPosition(self.white, self.black, self.side, self.passes, self.hash,
+                                self.white_count, self.black_count, self.empty_count,
+                                self.weight_score, OthelloPattern.compute_indices(self.board))
+
+    def bits(self, side):
+        """
+        Return the bitboards of side and its opponent.
+        """
+        if side == WHITE:
+            return self.white, self.black
+        return self.black, self.white
+
+    def as_bitboard(self):
+        """
+        Return the position itself.
+        """
+        return self
+
+    def flipped_squares(self, move_pos, side):
+        """
+        Return a list of positions that would be flipped by a tile played at move_pos.
+        """
+        own, opp = self.bits(side)
+        return bb.squares(bb.flips(own, opp, bb.SQUARE_TO_BIT[move_pos]))
+
+    def legal_move(self, move_pos, side):
+        """
+        Return False if move is not legal.
+        Return list of tiles to flip if legal.
+        """
+        bit = bb.SQUARE_TO_BIT[move_pos]
+        own, opp = self.bits(side)
+        if (own | opp) >> bit & 1:
+            return False
+        flipped = bb.flips(own, opp, bit)
+        if flipped == 0:
+            return False
+        return bb.squares(flipped)
+
+    def legal_moves(self, side):
+        """
+        Return a list of (move, flips) for every legal move of side, in BOARD_RANGE order.
+        flips is a bitboard here; it can be passed back to play.
+        """
+        own, opp = self.bits(side)
+        moves = []
+        remaining = bb.move_mask(own, opp)
+        while remaining:
+            low = remaining & -remaining
+            remaining ^= low
+            bit = low.bit_length() - 1
+            moves.append((bb.BIT_TO_SQUARE[bit], bb.flips(own, opp, bit)))
+        return moves
+
+    def moves(self):
+        """
+        Return (move, None) for every legal move of the side to move, in BOARD_RANGE
+        order. play finds the flips, so searches only work them out for the
+        moves they get to before a cutoff.
+        """
+        own, opp = self.bits(self.side)
+        moves = []
+        remaining = bb.move_mask(own, opp)
+        while remaining:
+            low = remaining & -remaining
+            remaining ^= low
+            moves.append((bb.BIT_TO_SQUARE[low.bit_length() - 1], None))
+        return moves
+
+    def has_moves(self, side):
+        """
+        Return True if side has a legal move.
+        """
+        own, opp = self.bits(side)
+        return bb.move_mask(own, opp) != 0
+
+    def mobility(self, side):
+        """
+        Return the number of legal moves of side.
+        """
+        own, opp = self.bits(side)
+        return bb.count(bb.move_mask(own, opp))
+
+    def play(self, move_pos, flipped=None):
+        """
+        Return the position after the side to move plays move_pos, None if that is illegal.
+        flipped is the flips legal_moves gave for this move, if known.
+        """
+        side = self.side
+        bit = bb.SQUARE_TO_BIT[move_pos]
+        own, opp = self.bits(side)
+        if flipped is None:
+            if (own | opp) >> bit & 1:
+                return None
+            flipped = bb.flips(own, opp, bit)
+            if flipped == 0:
+                return None
+        pattern_indices = self.pattern_indices
+        if pattern_indices is not None:
+            pattern_indices = pattern_indices[:]
+            OthelloPattern.update_bits(pattern_indices, bit, side, flipped)
+        new_hash = self.hash ^ PIECE_KEYS[side][move_pos]
+        weight_score = self.weight_score + side * ai.WEIGHTS[move_pos]
+        gain = side + side
+        flip_count = 0
+        remaining = flipped
+        while remaining:
+            low = remaining & -remaining
+            index = low.bit_length()-1
+            new_hash ^= BIT_FLIP_KEYS[index]
+            weight_score += gain * BIT_WEIGHTS[index]
+            flip_count += 1
+            remaining ^= low
+        own |= flipped | (1 << bit)
+        opp &= ~flipped
+        if side == WHITE:
+            return BitboardPosition(own, opp, -side, 0, new_hash, self.white_count + flip_count + 1,
+                                    self.black_count - flip_count, self.empty_count - 1,
+                                    weight_score, pattern_indices)
+        return BitboardPosition(opp, own, -side, 0, new_hash, self.white_count - flip_count,
+                                self.black_count + flip_count + 1, self.empty_count - 1,
+                                weight_score, pattern_indices)
+
+ENGINES = {"list": ListPosition, "bitboard": BitboardPosition}
+
+def from_board(board, side, engine="list", passes=0, patterns=False):
+    """
+    Return the position of a 100 integer board with side to move, stored by engine
+    ("list" or "bitboard"), keeping pattern indices if patterns is set.
+    """
+    if engine not in ENGINES:
+        raise ValueError("unknown engine %r" % engine)
+    board = board[:]
+    white_count, black_count, empty_count, weight_score = board_counts(board)
+    pattern_indices = OthelloPattern.compute_indices(board) if patterns else None
+    if engine == "list":
+        return ListPosition(board, side, passes, board_hash(board), white_count, black_count,
+                            empty_count, weight_score, pattern_indices)
+    white = black = 0
+    for bit, pos in enumerate(bb.BIT_TO_SQUARE):
+        if board[pos] == WHITE:
+            white |= 1 << bit
+        elif board[pos] == BLACK:
+            black |= 1 << bit
+    return BitboardPosition(white, black, side, passes, board_hash(board), white_count, black_count,
+                            empty_count, weight_score, pattern_indices)
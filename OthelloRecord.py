@@ -0,0 +1,207 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Game records for the Othello board game
+A record file is a magic string followed by one record per game: a small
+header (strategies, seed, final score, number of moves) then one byte per
+move, the bitboard index of the square or PASS. Files are appended to while
+games finish and read back with mmap, one record at a time
+Peter Elmers
+"""
+
+import OthelloBitboard as bb
+import argparse, mmap, os, struct, sys
+
+MAGIC = 'OTHREC01'
+# white strategy, black strategy, seed, white discs, black discs, number of moves
+HEADER = struct.Struct('<BBIBBB')
+# move byte of a pass, squares are 0-63
+PASS = 64
+# seed of games played without one
+NO_SEED = 0xFFFFFFFF
+# highest seed a record can hold
+MAX_SEED = NO_SEED - 1
+
+def check_seeds(seed, games):
+    """
+    Raise ValueError unless the seeds seed, seed+1... of games games all fit in a record.
+    """
+    if seed < 0 or seed + max(games, 1) - 1 > MAX_SEED:
+        raise ValueError("recorded games need seeds from 0 to %i, %i games from seed %i do not fit"
+                         % (MAX_SEED, games, seed))
+
+class GameRecord(object):
+    """
+    One game read from a record file. moves is the raw move bytes,
+    squares() decodes them to GameBoard squares with None for passes.
+    """
+    __slots__ = ('white', 'black', 'seed', 'white_discs', 'black_discs', 'moves')
+
+    def __init__(self, white, black, seed, white_discs, black_discs, moves):
+        self.white = white
+        self.black = black
+        self.seed = None if seed == NO_SEED else seed
+        self.white_discs = white_discs
+        self.black_discs = black_discs
+        self.moves = moves
+
+    def squares(self):
+        """
+        Return the moves as squares, None for a pass.
+        """
+        return [None if byte == PASS else bb.BIT_TO_SQUARE[byte] for byte in bytearray(self.moves)]
+
+    def victor(self):
+        """
+        Return WHITE (1), BLACK (-1) or 0 for a draw, like GameBoard.find_victor.
+        """
+        return cmp(self.white_discs, self.black_discs)
+
+def encode_moves(history):
+    """
+    Return the move bytes of a GameBoard.history.
+    """
+    return str(bytearray(PASS if pos is None else bb.SQUARE_TO_BIT[pos] for pos in history))
+
+class RecordWriter(object):
+    """
+    Appends game records to a file, writing the magic string if the file is new.
+    Each record is written as soon as it is given, nothing is kept in memory.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        else:
+            with open(path, 'rb') as existing:
+                if existing.read(len(MAGIC)) != MAGIC:
+                    self.file.close()
+                    raise ValueError("%s is not a game record file" % path)
+
+    def write(self, white, black, seed, white_discs, black_discs, history):
+        """
+        Append the record of a finished game, history as in GameBoard.history.
+        """
+        moves = encode_moves(history)
+        if seed is None:
+            seed = NO_SEED
+        else:
+            check_seeds(seed, 1)
+        self.file.write(HEADER.pack(white, black, seed, white_discs, black_discs, len(moves)))
+        self.file.write(moves)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class RecordReader(object):
+    """
+    Iterates over the records of a file through mmap, decoding one at a time.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = None
+        size = os.fstat(self.file.fileno()).st_size
+        if size > len(MAGIC):
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = self.data[:len(MAGIC)] if self.data is not None else self.file.read(len(MAGIC))
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("%s is not a game record file" % path)
+
+    def __iter__(self):
+        data = self.data
+        if data is None:
+            return
+        offset = len(MAGIC)
+        end = len(data)
+        while offset < end:
+            white, black, seed, white_discs, black_discs, count = HEADER.unpack_from(data, offset)
+            offset += HEADER.size
+            yield GameRecord(white, black, seed, white_discs, black_discs, data[offset:offset+count])
+            offset += count
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def opening_stats(records, plies=2):
+    """
+    Return a dictionary of the first plies moves (squares, None for a pass)
+    -> [games, black wins, white wins, draws].
+    """
+    stats = {}
+    for record in records:
+        opening = tuple(None if byte == PASS else bb.BIT_TO_SQUARE[byte]
+                        for byte in bytearray(record.moves[:plies]))
+        counts = stats.setdefault(opening, [0, 0, 0, 0])
+        counts[0] += 1
+        counts[{-1: 1, 1: 2, 0: 3}[record.victor()]] += 1
+    return stats
+
+def length_distribution(records):
+    """
+    Return a dictionary of the number of discs played (passes not counted) -> games.
+    """
+    lengths = {}
+    for record in records:
+        length = len(record.moves) - record.moves.count(chr(PASS))
+        lengths[length] = lengths.get(length, 0) + 1
+    return lengths
+
+def replay(record, engine="list"):
+    """
+    Return a GameBoard with the moves of record played, raising ValueError on an illegal move.
+    """
+    # imported here, Othello imports this module
+    import Othello
+    game = Othello.GameBoard(engine=engine)
+    for pos in record.squares():
+        if pos is None:
+            game.pass_turn()
+        else:
+            if game.make_move(pos, game.side) == False:
+                raise ValueError("illegal move %s in record" % pos)
+            game.last_move = pos
+        game.history.append(pos)
+    return game
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Summarize an Othello game record file.")
+    parser.add_argument("path", help="record file to read")
+    parser.add_argument("--openings", type=int, default=2, help="plies of the openings to tabulate")
+    parser.add_argument("--top", type=int, default=10, help="most played openings to show")
+    args = parser.parse_args(argv)
+    with RecordReader(args.path) as reader:
+        openings = opening_stats(reader, args.openings)
+    with RecordReader(args.path) as reader:
+        lengths = length_distribution(reader)
+    games = sum(lengths.values())
+    print "%i games" % games
+    if not games:
+        return
+    print "Openings (%i plies): games, black wins, white wins, draws" % args.openings
+    for opening, counts in sorted(openings.items(), key=lambda item: -item[1][0])[:args.top]:
+        print "%-20s %7i %6.1f%% %6.1f%% %6.1f%%" % (' '.join(str(pos) for pos in opening), counts[0],
+            100.0*counts[1]/counts[0], 100.0*counts[2]/counts[0], 100.0*counts[3]/counts[0])
+    print "Discs played: games"
+    for length in sorted(lengths):
+        print "%3i %7i" % (length, lengths[length])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
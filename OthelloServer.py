@@ -0,0 +1,348 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Game server for the Othello board game
+Hosts many games at once over TCP, one game per connection, speaking
+line-delimited JSON. AI moves are searched in a process pool, so a long
+search never holds up the other games
+Peter Elmers
+"""
+
+import Othello
+import OthelloAI as ai
+import argparse, asynchat, asyncore, collections, json, multiprocessing, os, socket, sys, time
+
+DEFAULT_PORT = 7077
+# seconds an AI may think per move when the client does not say
+DEFAULT_TIME_BUDGET = 1.0
+# the most an AI may think per move, whatever the client asks for
+MAX_TIME_BUDGET = 10.0
+# games that wait this many seconds for their client are closed
+IDLE_TIMEOUT = 600.0
+# searches waiting per worker before the server stops reading requests
+QUEUE_PER_WORKER = 2
+# longest request line accepted
+MAX_LINE = 4096
+
+def _search_move(task):
+    """
+    Return a dictionary of an AI move's move, nodes and seconds,
+    or of the error that stopped it. Runs in a pool worker.
+    """
+    engine, position, side, strat, time_budget, ai_options = task
+    try:
+        game = Othello.GameBoard(engine=engine)
+        game.load_position(position, side)
+        searcher = ai.OthelloAI(game, side, strat, time_budget=time_budget, **ai_options)
+        start = time.time()
+        move = searcher.find_move()
+        return {'move': move, 'nodes': searcher.nodes + searcher.solver.nodes,
+                'seconds': time.time() - start}
+    except Exception as error:
+        return {'error': repr(error)}
+
+class GameSession(asynchat.async_chat):
+    """
+    One connection and the game played on it.
+    Requests are one JSON object per line:
+    {"cmd": "new", "black": 0, "white": 4, "engine": "list", "time_budget": 1.0}
+        starts a game, black and white are strategies with 0 for the client
+    {"cmd": "move", "move": 34}
+        plays the client's move
+    {"cmd": "state"}
+        asks for the position again
+    The server answers with the position once it is the client's move or the
+    game is over: board (as GameBoard.position_string), side, moves, last_move,
+    black, white, over, victor when over and search for the last AI move.
+    Bad requests get {"error": message}.
+    """
+    def __init__(self, server, sock):
+        asynchat.async_chat.__init__(self, sock)
+        self.server = server
+        self.set_terminator('\n')
+        self.buffer = []
+        self.buffer_size = 0
+        self.game = None
+        self.sources = None
+        self.time_budget = None
+        self.last_search = None
+        # True while an AI move of this game is in the pool
+        self.thinking = False
+        # results of searches started before this number are stale
+        self.search_id = 0
+        self.last_active = time.time()
+
+    def readable(self):
+        # no new requests while this game's AI thinks, or while the pool is full
+        return not self.thinking and not self.server.saturated()
+
+    def collect_incoming_data(self, data):
+        self.buffer.append(data)
+        self.buffer_size += len(data)
+        if self.buffer_size > MAX_LINE:
+            self.reply({'error': "request longer than %i bytes" % MAX_LINE})
+            self.buffer = []
+            self.close_when_done()
+            self.server.sessions.discard(self)
+
+    def found_terminator(self):
+        line = ''.join(self.buffer)
+        self.buffer = []
+        self.buffer_size = 0
+        self.last_active = time.time()
+        if not line.strip():
+            return
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("requests are JSON objects")
+            handler = {'new': self.new_game, 'move': self.play_move,
+                       'state': self.send_state}.get(request.get('cmd'))
+            if handler is None:
+                raise ValueError("unknown cmd %r" % request.get('cmd'))
+            handler(request)
+        except (KeyError, TypeError, ValueError) as error:
+            self.reply({'error': str(error)})
+
+    def new_game(self, request):
+        sources = {Othello.BLACK: int(request.get('black', ai.HUMAN)),
+                   Othello.WHITE: int(request.get('white', ai.ALPHABETA))}
+        for source in sources.values():
+            if source not in (ai.HUMAN, ai.RANDOM, ai.SHALLOW, ai.MINIMAX, ai.ALPHABETA, ai.PVS, ai.MCTS):
+                raise ValueError("unknown strategy %r" % source)
+        engine = request.get('engine', 'list')
+        if engine not in ('list', 'bitboard'):
+            raise ValueError("unknown engine %r" % engine)
+        time_budget = float(request.get('time_budget', self.server.time_budget))
+        self.time_budget = max(0.0, min(time_budget, self.server.max_time_budget))
+        self.sources = sources
+        self.game = Othello.GameBoard(engine=engine)
+        self.last_search = None
+        self.search_id += 1
+        self.advance()
+
+    def play_move(self, request):
+        game = self.game
+        if game is None:
+            raise ValueError("no game, send a new cmd first")
+        if game.test_end() or self.sources[game.side] != ai.HUMAN:
+            raise ValueError("it is not the client's move")
+        move = int(request['move'])
+        flips = dict(game.legal_moves(game.side)).get(move)
+        if flips is None:
+            raise ValueError("illegal move %r" % move)
+        self.apply(move, flips)
+        self.advance()
+
+    def apply(self, move, flips=None):
+        """
+        Play move for the side to move, like GameBoard.play_turn.
+        """
+        game = self.game
+        game.last_move = move
+        game.history.append(move)
+        game.make_move(move, game.side, flips)
+
+    def advance(self):
+        """
+        Pass or start AI moves until it is the client's move or the game is over,
+        then send the position.
+        """
+        game = self.game
+        while not game.test_end():
+            if not game.test_possible_moves(game.side):
+                game.pass_turn()
+                game.history.append(None)
+                continue
+            source = self.sources[game.side]
+            if source == ai.HUMAN:
+                break
+            self.thinking = True
+            self.server.search(self, (game.engine, game.position_string(), game.side, source,
+                                      self.time_budget, self.server.ai_options))
+            return
+        self.send_state()
+
+    def ai_moved(self, search_id, result):
+        """
+        Play the move of a finished search, unless the game has moved on.
+        """
+        if search_id != self.search_id:
+            return
+        self.thinking = False
+        self.last_active = time.time()
+        self.last_search = result
+        if 'error' in result:
+            self.reply({'error': "AI search failed: %s" % result['error']})
+            return
+        self.apply(result['move'])
+        self.advance()
+
+    def send_state(self, request=None):
+        game = self.game
+        if game is None:
+            raise ValueError("no game, send a new cmd first")
+        victor, whites, blacks = game.find_victor()
+        over = game.test_end()
+        state = {'board': game.position_string(), 'side': game.side, 'over': over,
+                 'moves': [] if over else [pos for pos, flips in game.legal_moves(game.side)],
+                 'last_move': game.last_move if isinstance(game.last_move, int) else None,
+                 'black': blacks, 'white': whites}
+        if over:
+            state['victor'] = victor
+        if self.last_search is not None:
+            state['search'] = self.last_search
+        self.reply(state)
+
+    def reply(self, message):
+        self.push(json.dumps(message) + '\n')
+
+    def handle_close(self):
+        # a search still in the pool finds its game gone
+        self.search_id += 1
+        self.server.sessions.discard(self)
+        self.close()
+
+class _Waker(asyncore.file_dispatcher):
+    """
+    Pipe the pool's result thread writes to, so the event loop wakes up for results.
+    """
+    def __init__(self, server):
+        read_fd, self.write_fd = os.pipe()
+        asyncore.file_dispatcher.__init__(self, read_fd)
+        os.close(read_fd)
+        self.server = server
+
+    def wake(self):
+        os.write(self.write_fd, 'x')
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.recv(4096)
+        self.server.deliver_results()
+
+    def close(self):
+        asyncore.file_dispatcher.close(self)
+        os.close(self.write_fd)
+
+class GameServer(asyncore.dispatcher):
+    """
+    Accepts connections and runs a GameSession for each.
+    workers processes search the AI moves. Once workers*QUEUE_PER_WORKER
+    searches are waiting the server stops accepting and reading requests
+    until some finish.
+    """
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, workers=None,
+                 time_budget=DEFAULT_TIME_BUDGET, max_time_budget=MAX_TIME_BUDGET,
+                 idle_timeout=IDLE_TIMEOUT, ai_options=None):
+        asyncore.dispatcher.__init__(self)
+        self.workers = workers or multiprocessing.cpu_count()
+        # started before any socket is open, so the workers do not hold them
+        self.pool = multiprocessing.Pool(self.workers)
+        self.max_pending = self.workers * QUEUE_PER_WORKER
+        self.pending = 0
+        # (session, search_id, result) appended by the pool's result thread
+        self.results = collections.deque()
+        self.sessions = set()
+        self.time_budget = time_budget
+        self.max_time_budget = max_time_budget
+        self.idle_timeout = idle_timeout
+        self.ai_options = ai_options or {}
+        self.waker = _Waker(self)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.address = self.socket.getsockname()
+        self.listen(128)
+
+    def saturated(self):
+        """
+        Return True if the pool has as many searches as it should queue.
+        """
+        return self.pending >= self.max_pending
+
+    def readable(self):
+        return not self.saturated()
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is None:
+            return
+        sock, address = pair
+        self.sessions.add(GameSession(self, sock))
+
+    def search(self, session, task):
+        """
+        Search an AI move of session in the pool, session.ai_moved gets the result.
+        """
+        self.pending += 1
+        search_id = session.search_id
+        def done(result):
+            # runs in the pool's result thread, the event loop picks it up
+            self.results.append((session, search_id, result))
+            self.waker.wake()
+        self.pool.apply_async(_search_move, (task,), callback=done)
+
+    def deliver_results(self):
+        while self.results:
+            session, search_id, result = self.results.popleft()
+            self.pending -= 1
+            session.ai_moved(search_id, result)
+
+    def close_idle(self):
+        """
+        Close the games whose clients have not sent anything for idle_timeout seconds.
+        """
+        now = time.time()
+        for session in list(self.sessions):
+            if not session.thinking and now - session.last_active > self.idle_timeout:
+                session.reply({'error': "closed after %i idle seconds" % self.idle_timeout})
+                session.close_when_done()
+                self.sessions.discard(session)
+
+    def serve_forever(self):
+        try:
+            while True:
+                asyncore.loop(timeout=1.0, use_poll=True, count=1)
+                self.close_idle()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.pool.terminate()
+        self.pool.join()
+        for session in list(self.sessions):
+            session.close()
+        self.waker.close()
+        self.close()
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Host Othello games over TCP with line-delimited JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="processes searching AI moves (default: one per CPU)")
+    parser.add_argument("--time-budget", type=float, default=DEFAULT_TIME_BUDGET,
+                        help="seconds per AI move when the client does not say")
+    parser.add_argument("--max-time-budget", type=float, default=MAX_TIME_BUDGET,
+                        help="most seconds per AI move a client may ask for")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="seconds before a silent client's game is closed")
+    parser.add_argument("--book", help="opening book file for the AI players")
+    args = parser.parse_args(argv)
+    ai_options = {}
+    if args.book:
+        ai_options['book'] = args.book
+    server = GameServer(args.host, args.port, args.workers, args.time_budget,
+                        args.max_time_budget, args.idle_timeout, ai_options)
+    print "Serving Othello on %s:%i with %i workers" % (server.address[0], server.address[1], server.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
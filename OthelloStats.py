@@ -0,0 +1,167 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Search statistics for the Othello AI
+An OthelloAI created with stats=True keeps one record per move it finds,
+summaries add the records of whole games or simulations together
+Peter Elmers
+"""
+
+import time
+
+class SearchStats(object):
+    """
+    Counters of the move being searched, and the records of finished moves.
+    A record is a dictionary of:
+    move, source (strategy or "book", "endgame", "random"), depth, empties,
+    key (position_key of the searched position), nodes, leaves,
+    cutoffs (count per index of the move that caused it, 0 is the first move tried),
+    ebf (effective branching factor), seconds, plies (depth, seconds, nodes
+    of every finished deepening iteration), pv (principal variation),
+    playouts (of a Monte Carlo tree search, None for other sources) and
+    tt_hits, tt_misses, tt_collisions (transposition table probes of the move).
+    """
+    def __init__(self):
+        self.records = []
+        self.leaves = 0
+        self.cutoffs = []
+        self.plies = []
+        self.start = None
+        self.start_nodes = 0
+        self.start_tt = (0, 0, 0)
+
+    def start_move(self, searcher):
+        """
+        Reset the counters before searcher looks for a move.
+        """
+        self.leaves = 0
+        self.cutoffs = []
+        self.plies = []
+        self.start = time.time()
+        self.start_nodes = searcher.nodes + searcher.solver.nodes
+        self.start_tt = _tt_counts(searcher.tt)
+
+    def cutoff(self, index):
+        """
+        Count a cutoff caused by the move tried index-th at its node.
+        """
+        while len(self.cutoffs) <= index:
+            self.cutoffs.append(0)
+        self.cutoffs[index] += 1
+
+    def ply_done(self, searcher, depth):
+        """
+        Note that a deepening iteration to depth has finished.
+        """
+        self.plies.append((depth, time.time() - self.start,
+                           searcher.nodes + searcher.solver.nodes - self.start_nodes))
+
+    def end_move(self, searcher, move, key, empties, pv):
+        """
+        Store the record of the move searcher found and return it.
+        """
+        seconds = time.time() - self.start
+        nodes = searcher.nodes + searcher.solver.nodes - self.start_nodes
+        depth = searcher.last_depth
+        if not self.plies and depth is not None:
+            self.plies.append((depth, seconds, nodes))
+        ebf = None
+        if depth is not None and nodes:
+            # depth counts the plies below the root move
+            ebf = nodes ** (1.0 / (depth + 1))
+        hits, misses, collisions = [count - start for count, start in
+                                    zip(_tt_counts(searcher.tt), self.start_tt)]
+        record = {'move': move, 'source': searcher.last_source, 'depth': depth,
+                  'empties': empties, 'key': key, 'nodes': nodes, 'leaves': self.leaves,
+                  'cutoffs': self.cutoffs, 'ebf': ebf, 'seconds': seconds,
+                  'plies': self.plies, 'pv': pv, 'playouts': searcher.last_playouts,
+                  'tt_hits': hits, 'tt_misses': misses, 'tt_collisions': collisions}
+        self.records.append(record)
+        return record
+
+def _tt_counts(table):
+    counters = table.stats()
+    return counters['hits'], counters['misses'], counters['collisions']
+
+def format_record(record):
+    """
+    Return a record as one line of text for logs.
+    """
+    return ("move %s source %s depth %s empties %i nodes %i leaves %i cutoffs %s "
+            "ebf %s tt %i/%i/%i %.3fs pv %s key %016x") % (
+        record['move'], record['source'], record['depth'], record['empties'], record['nodes'],
+        record['leaves'], record['cutoffs'],
+        '%.2f' % record['ebf'] if record['ebf'] is not None else '-',
+        record['tt_hits'], record['tt_misses'], record['tt_collisions'],
+        record['seconds'], ' '.join(str(pos) for pos in record['pv']), record['key'])
+
+def summarize(records, summary=None):
+    """
+    Add records to a summary dictionary (a new one if summary is None) and return it.
+    The summary has moves, nodes, leaves, seconds, cutoffs per move index,
+    moves per source, playouts and the seconds of the moves that made them,
+    transposition table tt_hits, tt_misses and tt_collisions, and the slowest record.
+    """
+    if summary is None:
+        summary = {'moves': 0, 'nodes': 0, 'leaves': 0, 'seconds': 0.0, 'cutoffs': [],
+                   'sources': {}, 'playouts': 0, 'playout_seconds': 0.0, 'tt_hits': 0,
+                   'tt_misses': 0, 'tt_collisions': 0, 'slowest': None}
+    for record in records:
+        summary['moves'] += 1
+        for name in ('nodes', 'leaves', 'seconds', 'tt_hits', 'tt_misses', 'tt_collisions'):
+            summary[name] += record[name]
+        _add_counts(summary['cutoffs'], record['cutoffs'])
+        summary['sources'][record['source']] = summary['sources'].get(record['source'], 0) + 1
+        if record.get('playouts'):
+            summary['playouts'] += record['playouts']
+            summary['playout_seconds'] += record['seconds']
+        if summary['slowest'] is None or record['seconds'] > summary['slowest']['seconds']:
+            summary['slowest'] = record
+    return summary
+
+def merge(summary, other):
+    """
+    Add the summary other into summary and return summary.
+    """
+    for name in ('moves', 'nodes', 'leaves', 'seconds', 'playouts', 'playout_seconds',
+                 'tt_hits', 'tt_misses', 'tt_collisions'):
+        summary[name] += other[name]
+    _add_counts(summary['cutoffs'], other['cutoffs'])
+    for source, moves in other['sources'].items():
+        summary['sources'][source] = summary['sources'].get(source, 0) + moves
+    if other['slowest'] is not None and (summary['slowest'] is None or
+                                         other['slowest']['seconds'] > summary['slowest']['seconds']):
+        summary['slowest'] = other['slowest']
+    return summary
+
+def print_summary(summary):
+    """
+    Print a summary made by summarize.
+    """
+    moves = max(1, summary['moves'])
+    print "Searched %i moves: %i nodes, %i leaves, %.0f nodes per second" % (
+        summary['moves'], summary['nodes'], summary['leaves'],
+        summary['nodes'] / max(summary['seconds'], 1e-9))
+    print "Average per move: %.0f nodes, %.4f seconds" % (float(summary['nodes'])/moves,
+                                                          summary['seconds']/moves)
+    print "Moves by source: %s" % ', '.join('%s %i' % item for item in sorted(summary['sources'].items()))
+    if summary['playouts']:
+        print "Playouts: %i, %.0f per second" % (summary['playouts'],
+                                                  summary['playouts'] / max(summary['playout_seconds'], 1e-9))
+    probes = summary['tt_hits'] + summary['tt_misses']
+    if probes:
+        print "Transposition table: %i probes, %.1f%% hits, %i misses (%i to a bucket of other positions)" % (
+            probes, 100.0 * summary['tt_hits'] / probes, summary['tt_misses'], summary['tt_collisions'])
+    cutoffs = summary['cutoffs']
+    if cutoffs:
+        total = float(sum(cutoffs))
+        print "Cutoffs by move index: %s" % ' '.join('%i:%.1f%%' % (index, 100*count/total)
+                                                     for index, count in enumerate(cutoffs[:8]) if count)
+    if summary['slowest'] is not None:
+        print "Slowest move: %s" % format_record(summary['slowest'])
+
+def _add_counts(counts, other):
+    while len(counts) < len(other):
+        counts.append(0)
+    for index, count in enumerate(other):
+        counts[index] += count
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+#-*- coding:utf-8 -*-
+"""
+Zobrist hashing and transposition table for the Othello AI
+Peter Elmers
+"""
+
+import random
+
+# entry bound types
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+DEFAULT_SIZE = 2**16
+
+# fixed seed so every process (and every run) agrees on the keys
+_rng = random.Random(20120101)
+WHITE_KEYS = [_rng.getrandbits(64) for i in range(100)]
+BLACK_KEYS = [_rng.getrandbits(64) for i in range(100)]
+# xor of both colours, turns a white disc on pos into a black one and back
+FLIP_KEYS = [w ^ b for w, b in zip(WHITE_KEYS, BLACK_KEYS)]
+BLACK_TO_MOVE = _rng.getrandbits(64)
+del _rng
+
+class TranspositionTable(object):
+    """
+    Fixed size table of search results indexed by Zobrist key.
+    Each bucket has two slots: one keeps the deepest result stored there,
+    the other always takes the newest result that did not fit the first.
+    Entries are tuples of (key, depth, bound type, score, best move).
+    """
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.buckets = max(1, size // 2)
+        self.clear()
+
+    def clear(self):
+        """
+        Forget all entries and reset the counters.
+        """
+        self.deep = [None] * self.buckets
+        self.recent = [None] * self.buckets
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def probe(self, key):
+        """
+        Return the entry stored for key, or None if there is none.
+        """
+        index = key % self.buckets
+        entry = self.deep[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        other = self.recent[index]
+        if other is not None and other[0] == key:
+            self.hits += 1
+            return other
+        if entry is not None or other is not None:
+            # bucket is taken by different positions
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    def peek(self, key):
+        """
+        Return the entry stored for key like probe, without counting it.
+        """
+        index = key % self.buckets
+        for entry in (self.deep[index], self.recent[index]):
+            if entry is not None and entry[0] == key:
+                return entry
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        """
+        Store a search result, replacing depth-preferred then always-replace.
+        """
+        index = key % self.buckets
+        entry = (key, depth, flag, score, move)
+        deep = self.deep[index]
+        if deep is None or deep[0] == key or depth >= deep[1]:
+            self.deep[index] = entry
+        else:
+            self.recent[index] = entry
+
+    def stats(self):
+        """
+        Return a dictionary of the table's counters.
+        """
+        return {'size': self.size, 'hits': self.hits, 'misses': self.misses,
+                'collisions': self.collisions}